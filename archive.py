@@ -0,0 +1,382 @@
+"""Archival of closed activity periods, and activity partitioning on PostgreSQL.
+
+    python archive.py partition   # PostgreSQL: convert activity to range partitions
+    python archive.py archive     # move periods older than ARCHIVE_RETAIN_MONTHS out
+    python archive.py list
+    python archive.py verify      # re-hash every archive file
+
+Archived activities are written to gzipped JSONL files under ARCHIVE_DIR
+and removed from the activity table. An inventory snapshot is kept at the
+end of every archived period, so balances, point-in-time stock and the
+reports stay exact without the moved rows.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+from datetime import date, timedelta
+from typing import Iterator, List, Optional
+from sqlalchemy import delete, func, text
+from sqlmodel import Session, select
+
+from database import engine, create_db_and_tables
+from models import Item, Activity, ActivityArchive
+from inventory import DIRECTION_IN, archive_cutoff, counts_toward_stock, parse_movement
+from changes import record_reset
+from warehouses import default_warehouse_id
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+# "month" or "year"; also the size of the PostgreSQL partitions
+ARCHIVE_PERIOD = os.getenv("ARCHIVE_PERIOD", "month")
+# Periods that ended within this many months stay in the activity table
+ARCHIVE_RETAIN_MONTHS = int(os.getenv("ARCHIVE_RETAIN_MONTHS", "12"))
+# PostgreSQL: keep archived partitions as detached tables instead of dropping them
+ARCHIVE_KEEP_PARTITIONS = os.getenv("ARCHIVE_KEEP_PARTITIONS", "false").lower() in ("1", "true", "yes")
+# Partitions created ahead of today, so new entries rarely land in the default one
+PARTITIONS_AHEAD = 3
+ARCHIVE_BATCH_SIZE = 1000
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+# --- Periods ---
+def period_start(day: date) -> date:
+    return date(day.year, 1, 1) if ARCHIVE_PERIOD == "year" else date(day.year, day.month, 1)
+
+
+def next_period(start: date) -> date:
+    if ARCHIVE_PERIOD == "year":
+        return date(start.year + 1, 1, 1)
+    return date(start.year + (start.month == 12), start.month % 12 + 1, 1)
+
+
+def period_label(start: date) -> str:
+    return str(start.year) if ARCHIVE_PERIOD == "year" else f"{start.year}-{start.month:02d}"
+
+
+def _months_back(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def due_periods(session: Session):
+    """(start, end) of each closed period old enough to archive, oldest first."""
+    cutoff = archive_cutoff(session)
+    first = cutoff + timedelta(days=1) if cutoff else session.exec(select(func.min(Activity.activity_date))).one()
+    if first is None:
+        return []
+    keep_from = _months_back(date.today(), ARCHIVE_RETAIN_MONTHS)
+    periods = []
+    start = period_start(first)
+    while next_period(start) <= keep_from:
+        # max(): the first period may be partly archived if ARCHIVE_PERIOD changed
+        periods.append((max(start, first), next_period(start) - timedelta(days=1)))
+        start = next_period(start)
+    return periods
+
+
+# --- Writing archives ---
+def _json_default(value):
+    return value.isoformat()
+
+
+def _write_file(session: Session, path: str, criteria) -> int:
+    statement = (
+        Activity.__table__.select()
+        .where(*criteria)
+        .order_by(Activity.activity_date, Activity.id)
+        .execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+    )
+    rows = 0
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", encoding="utf-8") as f:
+        for row in session.execute(statement):
+            f.write(json.dumps(dict(row._mapping), default=_json_default, ensure_ascii=False) + "\n")
+            rows += 1
+    # Renamed only once complete, so a crash never leaves a truncated archive
+    os.replace(partial, path)
+    return rows
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def archive_period(session: Session, start: date, end: date) -> Optional[ActivityArchive]:
+    """Move activities dated start..end (inclusive) to a gzipped JSONL file."""
+    # Imported here: snapshots reads archived periods back through this module
+    from snapshots import latest_snapshot_date, write_snapshot
+
+    in_period = (Activity.activity_date >= start, Activity.activity_date <= end)
+    if not session.exec(select(func.count()).select_from(Activity).where(*in_period)).one():
+        return None
+    # The checkpoint that later balances and point-in-time queries start from
+    if latest_snapshot_date(session, end) != end:
+        write_snapshot(session, end)
+
+    label = period_label(start)
+    filename = f"activities_{label}.jsonl.gz"
+    path = os.path.join(ARCHIVE_DIR, filename)
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    rows = _write_file(session, path, in_period)
+
+    _detach_partition(session, start, end)
+    # Also catches rows that sat in the default partition
+    session.execute(delete(Activity).where(*in_period))
+    archive = ActivityArchive(period=label, period_start=start, period_end=end, filename=filename, rows=rows, sha256=_sha256(path))
+    session.add(archive)
+    # Clients holding the moved rows resync from scratch
+    record_reset(session, "activities")
+    session.commit()
+    session.refresh(archive)
+    return archive
+
+
+def archive_due_periods(session: Session) -> List[ActivityArchive]:
+    archived = []
+    for start, end in due_periods(session):
+        pending = session.exec(
+            select(func.count()).select_from(Activity)
+            .where(Activity.status == "Pending", Activity.activity_date >= start, Activity.activity_date <= end)
+        ).one()
+        if pending:
+            # Periods are archived in order; a pending approval holds back the rest
+            print(f"Stopped at {period_label(start)}: {pending} activities still pending approval")
+            break
+        archive = archive_period(session, start, end)
+        if archive:
+            archived.append(archive)
+    return archived
+
+
+# --- Reading archives ---
+def archive_path(archive: ActivityArchive) -> str:
+    return os.path.join(ARCHIVE_DIR, archive.filename)
+
+
+def archives_between(session: Session, start: Optional[date] = None, end: Optional[date] = None) -> List[ActivityArchive]:
+    statement = select(ActivityArchive).order_by(ActivityArchive.period_start)
+    if start:
+        statement = statement.where(ActivityArchive.period_end >= start)
+    if end:
+        statement = statement.where(ActivityArchive.period_start <= end)
+    return session.exec(statement).all()
+
+
+def missing_files(archives) -> List[str]:
+    return [archive.filename for archive in archives if not os.path.exists(archive_path(archive))]
+
+
+def _warehouse(row: dict) -> int:
+    # Files written before warehouses existed: everything was the default one
+    return row.get("warehouse_id") or default_warehouse_id()
+
+
+def _matches(row: dict, start: Optional[str], end: Optional[str], user: Optional[str], warehouse_id: Optional[int] = None) -> bool:
+    # ISO dates compare correctly as strings
+    day = row["activity_date"]
+    return (
+        (start is None or day >= start) and (end is None or day <= end) and (user is None or row["user"] == user)
+        and (warehouse_id is None or _warehouse(row) == warehouse_id)
+    )
+
+
+def archived_rows(
+    archives, start: Optional[date] = None, end: Optional[date] = None, user: Optional[str] = None, warehouse_id: Optional[int] = None
+) -> Iterator[dict]:
+    """Archived activities in range as dicts, reading one file at a time."""
+    start_key, end_key = start and start.isoformat(), end and end.isoformat()
+    for archive in archives:
+        with gzip.open(archive_path(archive), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if _matches(row, start_key, end_key, user, warehouse_id):
+                    yield row
+
+
+def stream_archive(
+    archives, start: Optional[date] = None, end: Optional[date] = None, user: Optional[str] = None, warehouse_id: Optional[int] = None
+) -> Iterator[bytes]:
+    """NDJSON body of archived activities, one activity per line."""
+    start_key, end_key = start and start.isoformat(), end and end.isoformat()
+    chunk, size = [], 0
+    for archive in archives:
+        # Periods wholly inside the range are passed through without parsing
+        whole = (
+            user is None and warehouse_id is None
+            and (start is None or start <= archive.period_start) and (end is None or end >= archive.period_end)
+        )
+        with gzip.open(archive_path(archive), "rb") as f:
+            for line in f:
+                if not whole and not _matches(json.loads(line), start_key, end_key, user, warehouse_id):
+                    continue
+                chunk.append(line)
+                size += len(line)
+                if size >= STREAM_CHUNK_BYTES:
+                    yield b"".join(chunk)
+                    chunk, size = [], 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def add_archived_movements(
+    session: Session, totals: dict, start: Optional[date] = None, end: Optional[date] = None,
+    user: Optional[str] = None, warehouse_id: Optional[int] = None,
+):
+    """Add archived approved movements to `totals`, keyed like inventory.movement_totals."""
+    archives = archives_between(session, start, end)
+    if not archives:
+        return totals
+    categories = {item_id: category for item_id, category in session.exec(select(Item.id, Item.category))}
+    for row in archived_rows(archives, start, end, user, warehouse_id):
+        if not counts_toward_stock(row["status"]):
+            continue
+        # Read from the action text, like the ledger: older files can carry
+        # client-sent direction/quantity that disagree with it
+        movement = parse_movement(row["action"])
+        if not movement:
+            continue
+        direction, quantity, name = movement
+        key = (_warehouse(row), name, row["item_category"] or categories.get(row["item_id"]) or "General")
+        totals[key] = totals.get(key, 0) + (quantity if direction == DIRECTION_IN else -quantity)
+    return totals
+
+
+def verify_archives(session: Session) -> List[str]:
+    """Filenames that are missing or no longer match their recorded hash."""
+    return [
+        archive.filename for archive in archives_between(session)
+        if not os.path.exists(archive_path(archive)) or _sha256(archive_path(archive)) != archive.sha256
+    ]
+
+
+# --- PostgreSQL partitioning ---
+def _partition_name(start: date) -> str:
+    return "activity_p" + period_label(start).replace("-", "_")
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('activity')")).first() is not None
+
+
+def _create_partition(conn, start: date, parent: str = "activity"):
+    name = _partition_name(start)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+        return
+    bounds = f"FROM ('{start.isoformat()}') TO ('{next_period(start).isoformat()}')"
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS)"))
+    # ATTACH refuses while the default partition still holds rows in range
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM activity_default WHERE activity_date >= :start AND activity_date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": start, "end": next_period(start)})
+    conn.execute(text(f"ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def _period_starts(first: date, last: date):
+    start = period_start(first)
+    while start <= last:
+        yield start
+        start = next_period(start)
+
+
+def partition_activities(engine) -> bool:
+    """Rebuild the activity table as range partitions on activity_date.
+
+    PostgreSQL only. Copies the table once under an exclusive lock, so run
+    it during a maintenance window. Returns False if there was nothing to do.
+    """
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return False
+        conn.execute(text("LOCK TABLE activity IN ACCESS EXCLUSIVE MODE"))
+        # No primary key: on a partitioned table it would have to include the
+        # (nullable) activity_date. ids still come from the same sequence.
+        conn.execute(text("CREATE TABLE activity_partitioned (LIKE activity INCLUDING DEFAULTS) PARTITION BY RANGE (activity_date)"))
+        # Undated rows, and dates outside every partition, land here
+        conn.execute(text("CREATE TABLE activity_default PARTITION OF activity_partitioned DEFAULT"))
+        first = conn.execute(text("SELECT min(activity_date) FROM activity")).scalar() or date.today()
+        last = date.today()
+        for _ in range(PARTITIONS_AHEAD):
+            last = next_period(period_start(last))
+        for start in _period_starts(first, last):
+            _create_partition(conn, start, parent="activity_partitioned")
+        conn.execute(text("INSERT INTO activity_partitioned SELECT * FROM activity"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('activity', 'id')")).scalar()
+        if sequence:
+            # Otherwise dropping the old table drops the id sequence with it
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY activity_partitioned.id"))
+        conn.execute(text("DROP TABLE activity"))
+        conn.execute(text("ALTER TABLE activity_partitioned RENAME TO activity"))
+        conn.execute(text("CREATE INDEX ix_activity_id ON activity (id)"))
+        conn.execute(text("ALTER TABLE activity ADD FOREIGN KEY (item_id) REFERENCES item (id)"))
+        conn.execute(text("ALTER TABLE activity ADD FOREIGN KEY (warehouse_id) REFERENCES warehouse (id)"))
+        for index in Activity.__table__.indexes:
+            index.create(conn, checkfirst=True)
+    return True
+
+
+def ensure_partitions(engine):
+    """Create partitions for the current and coming periods, once partitioned."""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return
+        start = period_start(date.today())
+        for _ in range(PARTITIONS_AHEAD + 1):
+            _create_partition(conn, start)
+            start = next_period(start)
+
+
+def _detach_partition(session: Session, start: date, end: date):
+    # Detaching is instant, unlike a DELETE of the whole period
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    if start != period_start(start) or end != next_period(start) - timedelta(days=1):
+        return
+    name = _partition_name(start)
+    attached = session.execute(
+        text("SELECT 1 FROM pg_inherits WHERE inhparent = to_regclass('activity') AND inhrelid = to_regclass(:name)"),
+        {"name": name},
+    ).first()
+    if not attached:
+        return
+    session.execute(text(f"ALTER TABLE activity DETACH PARTITION {name}"))
+    if ARCHIVE_KEEP_PARTITIONS:
+        session.execute(text(f"ALTER TABLE {name} RENAME TO activity_cold_{name[len('activity_p'):]}"))
+    else:
+        session.execute(text(f"DROP TABLE {name}"))
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    create_db_and_tables()
+    if command == "partition":
+        if partition_activities(engine):
+            print("Activity table is now partitioned by activity_date.")
+        else:
+            print("Nothing to do (not PostgreSQL, or already partitioned).")
+        sys.exit(0)
+    with Session(engine) as session:
+        if command == "archive":
+            ensure_partitions(engine)
+            archived = archive_due_periods(session)
+            for archive in archived:
+                print(f"Archived {archive.period}: {archive.rows} activities -> {archive_path(archive)}")
+            print(f"Archived {len(archived)} period(s); activity table now starts after {archive_cutoff(session)}.")
+        elif command == "verify":
+            bad = verify_archives(session)
+            if bad:
+                print(f"Missing or modified archive files: {', '.join(bad)}")
+                sys.exit(1)
+            print("All archive files match their recorded hashes.")
+        else:
+            for archive in archives_between(session):
+                print(f"{archive.period}  {archive.period_start} .. {archive.period_end}  {archive.rows:>8} rows  {archive.filename}")
@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import io
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from fastapi import Request, Response
+
+# Optional: brotli and Pillow add .br and .webp variants when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+ASSET_EXTENSIONS = {".html", ".js", ".css", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp"}
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".css", ".svg"}
+WEBP_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+ASSET_URL_PREFIX = "/assets/"
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+
+@dataclass
+class Asset:
+    name: str  # logical name, e.g. "script.js"
+    fingerprinted: str  # e.g. "script.3f2a9c1b7d.js"
+    media_type: str
+    etag: str
+    body: bytes
+    # Alternate representations keyed by Content-Encoding ("br", "gzip") ...
+    encodings: Dict[str, bytes] = field(default_factory=dict)
+    # ... or by media type for images ("image/webp")
+    webp: Optional[bytes] = None
+
+
+class AssetManifest:
+    """In-memory table of every servable static file, built once at startup.
+
+    Requests are answered from memory, so serving a file no longer probes
+    the filesystem, and only files listed here can be served at all.
+    """
+
+    def __init__(self):
+        self.by_name: Dict[str, Asset] = {}
+        self.by_fingerprint: Dict[str, Asset] = {}
+
+    def build(self, static_dir: str):
+        by_name = {}
+        names = sorted(
+            name for name in os.listdir(static_dir)
+            if os.path.splitext(name)[1].lower() in ASSET_EXTENSIONS
+            and os.path.isfile(os.path.join(static_dir, name))
+        )
+        # HTML last: it references the fingerprinted names of everything else
+        names.sort(key=lambda name: name.endswith(".html"))
+        for name in names:
+            with open(os.path.join(static_dir, name), "rb") as f:
+                body = f.read()
+            if name.endswith(".html"):
+                body = self._rewrite_references(body, by_name)
+            by_name[name] = _build_asset(name, body)
+        self.by_name = by_name
+        self.by_fingerprint = {asset.fingerprinted: asset for asset in by_name.values()}
+        return self
+
+    @staticmethod
+    def _rewrite_references(html: bytes, assets: Dict[str, Asset]) -> bytes:
+        text = html.decode("utf-8")
+        for name, asset in assets.items():
+            if name.endswith(".html"):
+                # Pages keep stable URLs; only their subresources are fingerprinted
+                continue
+            # Only exact quoted/url() references, e.g. src="script.js" or url('x.png')
+            pattern = r"""(?<=["'(])%s(?=["')])""" % re.escape(name)
+            text = re.sub(pattern, ASSET_URL_PREFIX + asset.fingerprinted, text)
+        return text.encode("utf-8")
+
+    def url_for(self, name: str) -> str:
+        return ASSET_URL_PREFIX + self.by_name[name].fingerprinted
+
+    def stats(self):
+        return {
+            name: {
+                "url": self.url_for(name),
+                "bytes": len(asset.body),
+                **{encoding: len(data) for encoding, data in asset.encodings.items()},
+                **({"webp": len(asset.webp)} if asset.webp else {}),
+            }
+            for name, asset in self.by_name.items()
+        }
+
+
+def _build_asset(name: str, body: bytes) -> Asset:
+    stem, ext = os.path.splitext(name)
+    ext = ext.lower()
+    digest = hashlib.sha256(body).hexdigest()[:10]
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    if ext in COMPRESSIBLE_EXTENSIONS:
+        media_type += "; charset=utf-8"
+    asset = Asset(name=name, fingerprinted=f"{stem}.{digest}{ext}", media_type=media_type, etag=f'"{digest}"', body=body)
+
+    if ext in COMPRESSIBLE_EXTENSIONS:
+        if brotli is not None:
+            asset.encodings["br"] = brotli.compress(body, quality=11)
+        asset.encodings["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+    if ext in WEBP_EXTENSIONS and Image is not None:
+        try:
+            with Image.open(io.BytesIO(body)) as image:
+                out = io.BytesIO()
+                image.save(out, format="WEBP", quality=80, method=6)
+            if out.tell() < len(body):
+                asset.webp = out.getvalue()
+        except (OSError, ValueError):
+            pass
+    # Drop variants that don't actually save bytes
+    asset.encodings = {k: v for k, v in asset.encodings.items() if len(v) < len(body)}
+    return asset
+
+
+def _accepts(header: str, token: str) -> bool:
+    for part in header.split(","):
+        value, _, params = part.partition(";")
+        if value.strip().lower() != token:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, number = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        return quality > 0
+    return False
+
+
+def asset_response(request: Request, asset: Asset, immutable: bool) -> Response:
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+        "ETag": asset.etag,
+    }
+    vary = []
+    body, media_type = asset.body, asset.media_type
+
+    if asset.webp is not None:
+        vary.append("Accept")
+        if _accepts(request.headers.get("accept", ""), "image/webp"):
+            body, media_type = asset.webp, "image/webp"
+            headers["ETag"] = asset.etag[:-1] + '-webp"'
+    if asset.encodings:
+        vary.append("Accept-Encoding")
+        accept_encoding = request.headers.get("accept-encoding", "")
+        for encoding in ("br", "gzip"):
+            if encoding in asset.encodings and _accepts(accept_encoding, encoding):
+                body = asset.encodings[encoding]
+                headers["Content-Encoding"] = encoding
+                headers["ETag"] = asset.etag[:-1] + f'-{encoding}"'
+                break
+    if vary:
+        headers["Vary"] = ", ".join(vary)
+
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+asset_manifest = AssetManifest()
+
+
+if __name__ == "__main__":
+    import json
+    manifest = AssetManifest().build(os.path.dirname(os.path.abspath(__file__)))
+    print(json.dumps(manifest.stats(), indent=2))
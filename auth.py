@@ -1,14 +1,26 @@
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 # Security config
-SECRET_KEY = "S0M3_S3CR3T_K3Y_CH4NG3_TH1S"  # In production, use env var
+# Every worker must share the same key, or tokens from one fail on another
+SECRET_KEY = os.getenv("SECRET_KEY", "S0M3_S3CR3T_K3Y_CH4NG3_TH1S")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 day
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", str(60 * 24)))  # 1 day
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Hashing cost: pbkdf2 iterations for new hashes (passlib's default is 29000).
+# Existing hashes keep verifying with the rounds they were created with.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+# Worker processes for hashing; 0 hashes in the request thread instead
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto", pbkdf2_sha256__rounds=PASSWORD_HASH_ROUNDS)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -16,6 +28,59 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# --- Off-thread hashing ---
+# pbkdf2 is CPU-bound and holds the GIL, so it runs in a small process pool
+# instead of tying up the request threadpool. The pool is created on first use.
+_hash_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_hash_stats = {"submitted": 0, "completed": 0, "pending": 0, "peak_pending": 0}
+
+def _get_hash_pool():
+    global _hash_pool
+    with _pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        return _hash_pool
+
+def _on_done(_future):
+    with _stats_lock:
+        _hash_stats["completed"] += 1
+        _hash_stats["pending"] -= 1
+
+async def _run_hashing(func, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return await asyncio.to_thread(func, *args)
+    with _stats_lock:
+        _hash_stats["submitted"] += 1
+        _hash_stats["pending"] += 1
+        _hash_stats["peak_pending"] = max(_hash_stats["peak_pending"], _hash_stats["pending"])
+    future = _get_hash_pool().submit(func, *args)
+    future.add_done_callback(_on_done)
+    return await asyncio.wrap_future(future)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_hashing(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_hashing(get_password_hash, password)
+
+async def get_password_hashes_async(passwords: List[str]) -> List[str]:
+    # Submitted together, so a migration hashes in parallel across the pool
+    return list(await asyncio.gather(*(get_password_hash_async(p) for p in passwords)))
+
+def hashing_stats():
+    with _stats_lock:
+        # pending counts jobs queued plus running; beyond `workers` they wait
+        return {"workers": PASSWORD_HASH_WORKERS, "rounds": PASSWORD_HASH_ROUNDS, **_hash_stats}
+
+def shutdown_hash_pool():
+    global _hash_pool
+    with _pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -25,3 +90,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+def decode_access_token(token: str) -> dict:
+    # Raises JWTError for a bad signature or an expired token
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def password_fingerprint(password_hash: str) -> str:
+    # Carried in tokens, so changing the password invalidates the old ones
+    return hashlib.sha256(password_hash.encode()).hexdigest()[:16]
@@ -0,0 +1,355 @@
+"""Load test against a synthetic warehouse, driven in-process over ASGI.
+
+    python benchmark.py --items 1000 --activities 1000000 --output results.json
+    python benchmark.py --reuse --compare results.json
+
+Seeds its own database (benchmark.db by default, never local_test.db),
+runs every scenario with the same request count and concurrency, and
+writes latency percentiles and throughput as JSON so runs from different
+commits on the same machine can be compared.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+CATEGORIES = ["Electronics", "Furniture", "Special Education", "Stationary", "Sports", "Kitchen"]
+STATUSES = ["Approved"] * 8 + ["Pending", "Rejected"]
+SEED_BATCH_SIZE = 10000
+# Background work pinned off (or to fixed settings) so runs are comparable:
+# nothing writes snapshots, checks a replica or logs mid-scenario
+PINNED_ENV = {
+    "SNAPSHOT_INTERVAL": "off",
+    "EVENT_POLL_INTERVAL": "1",
+    "SLOW_REQUEST_MS": "inf",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--activities", type=int, default=100000)
+    parser.add_argument("--warehouses", type=int, default=4, help="activities are spread across this many warehouses")
+    parser.add_argument("--database-url", default="sqlite:///" + os.path.join(current_dir, "benchmark.db"))
+    parser.add_argument("--reuse", action="store_true", help="keep an already seeded database")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", default="", help="comma-separated subset of scenarios")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to print deltas against")
+    return parser.parse_args()
+
+
+# --- Synthetic dataset ---
+def seed(n_items: int, n_activities: int, n_warehouses: int, rng: random.Random):
+    from sqlalchemy import insert
+    from sqlmodel import Session, delete, select
+    from database import engine
+    from models import Warehouse, Item, Activity, StockBalance, DailyMovement, InventorySnapshot, ImportBatch
+    from inventory import ACTION_IN, ACTION_OUT, DIRECTION_IN, DIRECTION_OUT, counts_toward_stock
+    from changes import record_reset
+
+    users = ["maxamed", "abdinur", "salah", "admin"]
+    items = [{"name": f"Item {i:05d}", "category": CATEGORIES[i % len(CATEGORIES)]} for i in range(n_items)]
+    first_day = date.today() - timedelta(days=730)
+    balances = {}
+
+    with Session(engine) as session:
+        for model in (StockBalance, DailyMovement, InventorySnapshot, Activity, Item, ImportBatch):
+            session.execute(delete(model))
+        item_ids = list(session.execute(insert(Item).returning(Item.id), items).scalars())
+        # The default warehouse (from the migrations) plus regional ones
+        for i in range(len(session.exec(select(Warehouse)).all()), max(n_warehouses, 1)):
+            session.add(Warehouse(name=f"Region {i:02d}"))
+        session.commit()
+        warehouse_ids = session.exec(select(Warehouse.id).order_by(Warehouse.id)).all()[:max(n_warehouses, 1)]
+
+        created_at = datetime.now()
+        for start in range(0, n_activities, SEED_BATCH_SIZE):
+            rows = []
+            for _ in range(min(SEED_BATCH_SIZE, n_activities - start)):
+                index = rng.randrange(n_items)
+                item = items[index]
+                # Mostly inbound so balances stay positive
+                inbound = rng.random() < 0.6
+                quantity = rng.randint(1, 20)
+                day = first_day + timedelta(days=rng.randrange(730))
+                status = rng.choice(STATUSES)
+                warehouse_id = rng.choice(warehouse_ids)
+                rows.append({
+                    "date": day.strftime("%d/%m/%Y"),
+                    "activity_date": day,
+                    "action": f"{ACTION_IN if inbound else ACTION_OUT}: {quantity} {item['name']}",
+                    "item_category": item["category"],
+                    "recipient": f"School {rng.randrange(50)}",
+                    "user": rng.choice(users),
+                    "status": status,
+                    "created_at": created_at,
+                    "direction": DIRECTION_IN if inbound else DIRECTION_OUT,
+                    "quantity": quantity,
+                    "item_id": item_ids[index],
+                    "item_name": item["name"],
+                    "warehouse_id": warehouse_id,
+                })
+                if counts_toward_stock(status):
+                    key = (warehouse_id, item["name"], item["category"])
+                    balances[key] = balances.get(key, 0) + (quantity if inbound else -quantity)
+            session.execute(insert(Activity), rows)
+            session.commit()
+
+        # The generator knows every movement, so balances need no replay
+        session.execute(insert(StockBalance), [
+            {"warehouse_id": warehouse_id, "item_name": name, "category": category, "quantity": quantity, "updated_at": created_at}
+            for (warehouse_id, name, category), quantity in balances.items()
+        ])
+        record_reset(session, "items")
+        record_reset(session, "activities")
+        session.commit()
+
+
+# --- Load generation ---
+def percentile(sorted_values, fraction: float) -> float:
+    # Nearest-rank, so the value is one that was actually observed
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def run_scenario(client, make_request, n_requests: int, concurrency: int):
+    latencies = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                await response.aread()
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "throughput_rps": round(n_requests / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def build_scenarios(pending_ids, rng: random.Random, n_items: int, warehouse_id: int):
+    today = date.today()
+    month_start = (today - timedelta(days=30)).isoformat()
+
+    def login(client, i):
+        return client.post("/api/login", json={"username": "admin", "password": "admin123"})
+
+    def list_items(client, i):
+        return client.get("/api/items", params={"limit": 0})
+
+    def list_activities(client, i):
+        return client.get("/api/activities", params={"limit": 100})
+
+    def list_activities_full(client, i):
+        # The whole list the dashboard loads; run with few --requests
+        return client.get("/api/activities", params={"limit": 0})
+
+    def list_activities_filtered(client, i):
+        return client.get("/api/activities", params={"start": month_start, "user": "salah", "limit": 100})
+
+    def create_activity(client, i):
+        return client.post("/api/activities", json={
+            "date": today.strftime("%d/%m/%Y"),
+            "action": f"Geliyay: {rng.randint(1, 5)} Item {rng.randrange(n_items):05d}",
+            "recipient": "Benchmark",
+            "user": "salah",
+            "status": "Pending",
+        })
+
+    def approve(client, i):
+        # Every request approves a different pending activity
+        return client.post("/api/approvals/batch", json={"ids": [pending_ids[i % len(pending_ids)]], "status": "Approved"})
+
+    def inventory(client, i):
+        return client.get("/api/inventory")
+
+    def inventory_warehouse(client, i):
+        # What a regional office's dashboard loads
+        return client.get("/api/inventory", params={"warehouse_id": warehouse_id})
+
+    def stats(client, i):
+        return client.get("/api/stats", params={"days": 30})
+
+    def stats_warehouse(client, i):
+        return client.get("/api/stats", params={"days": 30, "warehouse_id": warehouse_id})
+
+    def report_inventory(client, i):
+        return client.get("/api/reports/inventory", params={"format": "csv"})
+
+    def report_movement_month(client, i):
+        return client.get("/api/reports/movement", params={"format": "csv", "start": month_start})
+
+    return {
+        "login": login,
+        "list_items": list_items,
+        "list_activities": list_activities,
+        "list_activities_full": list_activities_full,
+        "list_activities_filtered": list_activities_filtered,
+        "create_activity": create_activity,
+        "approve": approve,
+        "inventory": inventory,
+        "inventory_warehouse": inventory_warehouse,
+        "stats": stats,
+        "stats_warehouse": stats_warehouse,
+        "report_inventory": report_inventory,
+        "report_movement_month": report_movement_month,
+    }
+
+
+def table_counts():
+    from sqlalchemy import func
+    from sqlmodel import Session, select
+    from database import engine
+    from models import Warehouse, Item, Activity
+
+    with Session(engine) as session:
+        return (
+            session.exec(select(func.count()).select_from(Item)).one(),
+            session.exec(select(func.count()).select_from(Activity)).one(),
+            session.exec(select(func.count()).select_from(Warehouse)).one(),
+        )
+
+
+async def drive(args, rng: random.Random, n_items: int):
+    import httpx
+    from main import app
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport doesn't send lifespan events; run startup/shutdown here
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            # An approver, so every scenario (approvals included) is allowed
+            login = await client.post("/api/login", json={"username": "admin", "password": "admin123"})
+            client.headers["Authorization"] = f"Bearer {login.json()['access_token']}"
+            pending = await client.get("/api/approvals", params={"fields": "id", "limit": max(args.requests, 1)})
+            pending_ids = [row["id"] for row in pending.json()] or [0]
+            warehouses = (await client.get("/api/warehouses")).json()
+            scenarios = build_scenarios(pending_ids, rng, max(n_items, 1), warehouses[-1]["id"])
+            selected = [name.strip() for name in args.scenarios.split(",") if name.strip()] or list(scenarios)
+            for name in selected:
+                # A few warm-up requests so caches and pools are primed
+                await run_scenario(client, scenarios[name], min(5, args.requests), 1)
+                results[name] = await run_scenario(client, scenarios[name], args.requests, args.concurrency)
+                print(f"{name:26s} {results[name]['throughput_rps']:>9.1f} req/s  "
+                      f"p50 {results[name]['p50_ms']:>8.2f}  p95 {results[name]['p95_ms']:>8.2f}  "
+                      f"p99 {results[name]['p99_ms']:>8.2f} ms  errors {results[name]['errors']}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=current_dir, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(previous_path: str, results: dict):
+    with open(previous_path) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} (commit {previous.get('commit')}):")
+    for name, current in results.items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if before[key]:
+                deltas.append(f"{key} {(current[key] - before[key]) / before[key] * 100:+.1f}%")
+        print(f"{name:26s} " + "  ".join(deltas))
+
+
+def main():
+    args = parse_args()
+    # Must be set before database.py (and main.py) is imported
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.update(PINNED_ENV)
+    os.environ.pop("DATABASE_READ_URL", None)
+    rng = random.Random(args.random_seed)
+
+    from database import engine, create_db_and_tables
+    from migrations import run_migrations
+
+    seed_seconds = None
+    if args.database_url.startswith("sqlite:///") and not args.reuse:
+        path = args.database_url[len("sqlite:///"):]
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    create_db_and_tables()
+    run_migrations(engine)
+    if not args.reuse:
+        started = time.perf_counter()
+        seed(args.items, args.activities, args.warehouses, rng)
+        seed_seconds = round(time.perf_counter() - started, 2)
+        print(f"Seeded {args.items} items and {args.activities} activities in {seed_seconds}s")
+
+    # Measured rather than taken from the arguments, so --reuse runs are labelled right
+    n_items, n_activities, n_warehouses = table_counts()
+    results = asyncio.run(drive(args, rng, n_items))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": engine.dialect.name,
+        "config": {
+            "items": n_items,
+            "activities": n_activities,
+            "warehouses": n_warehouses,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "random_seed": args.random_seed,
+            "db_async": os.getenv("DB_ASYNC", "false"),
+            "pinned_env": PINNED_ENV,
+        },
+        "seed_seconds": seed_seconds,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        print_comparison(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import json
+from typing import List, Optional
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from models import Item, Activity, ImportBatch
+from inventory import apply_activities, archive_cutoff, item_index, populate_movement, populate_activity_date
+from changes import record_inserts
+from warehouses import known_warehouse, populate_warehouse
+
+# Larger payloads should be split by the client
+MAX_BULK_ROWS = 5000
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+def _validate(model, rows: List[dict]):
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, model.model_validate(row)))
+        except ValidationError as e:
+            errors.append({"index": index, "error": _describe(e)})
+    return valid, errors
+
+
+def _insert_many(session: Session, model, table_name: str, objects) -> List[int]:
+    """Write validated objects with multi-row INSERT ... VALUES statements.
+
+    The ORM falls back to one INSERT per object when it can't guarantee the
+    order of RETURNING (SQLite), so this goes through Core instead and logs
+    the new ids for /api/sync itself.
+    """
+    if not objects:
+        return []
+    rows = [obj.model_dump(exclude={"id"}) for obj in objects]
+    ids = sorted(session.execute(insert(model).returning(model.id), rows).scalars().all())
+    record_inserts(session, table_name, ids)
+    return ids
+
+
+def import_items(session: Session, rows: List[dict]):
+    valid, errors = _validate(Item, rows)
+    ids = _insert_many(session, Item, "items", [item for _, item in valid])
+    return ids, errors
+
+
+def import_activities(session: Session, rows: List[dict]):
+    valid, errors = _validate(Activity, rows)
+
+    # Resolve item ids from one item query rather than one per row
+    items = item_index(session)
+    cutoff = archive_cutoff(session)
+    activities = []
+    for index, activity in valid:
+        # Only POST /api/transfers links legs together
+        activity.transfer_id = None
+        populate_movement(session, activity, items)
+        populate_activity_date(activity)
+        populate_warehouse(session, activity)
+        if not known_warehouse(session, activity.warehouse_id):
+            errors.append({"index": index, "error": f"warehouse_id: unknown warehouse {activity.warehouse_id}"})
+            continue
+        if cutoff and activity.activity_date and activity.activity_date <= cutoff:
+            errors.append({"index": index, "error": f"date: periods up to {cutoff} are archived"})
+            continue
+        activities.append(activity)
+    errors.sort(key=lambda error: error["index"])
+
+    ids = _insert_many(session, Activity, "activities", activities)
+    apply_activities(session, activities)
+    return ids, errors
+
+
+_IMPORTERS = {"items": import_items, "activities": import_activities}
+
+
+def run_import(session: Session, kind: str, rows: List[dict], batch_key: Optional[str] = None):
+    """Insert all valid rows in one transaction and report the invalid ones.
+
+    With a batch_key, the first result is stored and returned again for any
+    retry of the same key, so a client can safely resend after a timeout.
+    """
+    if batch_key:
+        previous = session.exec(select(ImportBatch).where(ImportBatch.batch_key == batch_key)).first()
+        if previous:
+            return _replay(previous, kind)
+
+    ids, errors = _IMPORTERS[kind](session, rows)
+    result = {"batch_key": batch_key, "inserted": len(ids), "ids": ids, "errors": errors}
+    if batch_key:
+        session.add(ImportBatch(batch_key=batch_key, kind=kind, result=json.dumps(result)))
+    try:
+        session.commit()
+    except IntegrityError:
+        # Another request committed the same batch_key first
+        session.rollback()
+        if not batch_key:
+            raise
+        previous = session.exec(select(ImportBatch).where(ImportBatch.batch_key == batch_key)).first()
+        if not previous:
+            raise
+        return _replay(previous, kind)
+    return {**result, "replayed": False}
+
+
+def _replay(previous: ImportBatch, kind: str):
+    # Keys are unique across kinds: an items key never answers an activities import
+    if previous.kind != kind:
+        raise HTTPException(status_code=409, detail=f"batch_key was already used for a {previous.kind} import")
+    return {**json.loads(previous.result), "replayed": True}
@@ -0,0 +1,132 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event, insert, func
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from models import Warehouse, Item, Activity, User, ChangeLog
+
+# Tables that clients can sync incrementally, keyed by the name used in
+# the change log and the /api/sync payload.
+TRACKED_TABLES = {"items": Item, "activities": Activity, "users": User}
+# Also journalled, so ETags and cached lists see their version, but not synced
+VERSIONED_TABLES = {**TRACKED_TABLES, "warehouses": Warehouse}
+_TABLE_NAMES = {model: name for name, model in VERSIONED_TABLES.items()}
+
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+OP_RESET = "reset"  # written when a table is wiped outside the ORM (seed_data.py)
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _touch_updated_at(session, flush_context, instances):
+    now = datetime.utcnow()
+    for obj in session.dirty:
+        if type(obj) in _TABLE_NAMES and session.is_modified(obj):
+            obj.updated_at = now
+
+
+@event.listens_for(OrmSession, "after_flush")
+def _record_changes(session, flush_context):
+    # Runs inside the same transaction as the flush, so a rolled-back write
+    # never leaves a change entry behind.
+    now = datetime.utcnow()
+    rows = []
+    for obj in session.new:
+        if type(obj) in _TABLE_NAMES:
+            rows.append({"table_name": _TABLE_NAMES[type(obj)], "row_id": obj.id, "op": OP_UPSERT, "changed_at": now})
+    for obj in session.dirty:
+        if type(obj) in _TABLE_NAMES and session.is_modified(obj, include_collections=False):
+            rows.append({"table_name": _TABLE_NAMES[type(obj)], "row_id": obj.id, "op": OP_UPSERT, "changed_at": now})
+    for obj in session.deleted:
+        if type(obj) in _TABLE_NAMES:
+            rows.append({"table_name": _TABLE_NAMES[type(obj)], "row_id": obj.id, "op": OP_DELETE, "changed_at": now})
+    if rows:
+        session.connection().execute(_log_insert(session), rows)
+        session.info["logged_changes"] = True
+
+
+@event.listens_for(OrmSession, "after_transaction_end")
+def _clear_change_flag(session, transaction):
+    # Listeners on after_commit (etags, events) read the flag before this runs
+    if transaction.parent is None:
+        session.info.pop("logged_changes", None)
+
+
+def record_inserts(session: Session, table_name: str, ids):
+    # For rows written with Core bulk INSERTs, which bypass the flush hooks
+    if not ids:
+        return
+    now = datetime.utcnow()
+    session.execute(_log_insert(session), [
+        {"table_name": table_name, "row_id": row_id, "op": OP_UPSERT, "changed_at": now} for row_id in ids
+    ])
+    session.info["logged_changes"] = True
+
+
+def record_reset(session: Session, table_name: str):
+    session.execute(_log_insert(session), [
+        {"table_name": table_name, "row_id": 0, "op": OP_RESET, "changed_at": datetime.utcnow()}
+    ])
+    session.info["logged_changes"] = True
+
+
+def _commit_ordered_ids(session) -> bool:
+    # SQLite has one writer at a time, so ids commit in the order they are
+    # handed out. PostgreSQL draws them from a sequence at insert time: a
+    # slow transaction can commit an id below one a reader has already seen.
+    return session.get_bind().dialect.name != "postgresql"
+
+
+def _log_insert(session):
+    if _commit_ordered_ids(session):
+        return insert(ChangeLog)
+    return insert(ChangeLog).values(txid=func.txid_current())
+
+
+def _position(session):
+    return ChangeLog.id if _commit_ordered_ids(session) else ChangeLog.txid
+
+
+def current_cursor(session: Session) -> int:
+    """Position below which every change_log entry has committed or rolled back.
+
+    Cursors are half-open: a client holding one has seen everything before
+    it and nothing at or after it. On PostgreSQL positions are transaction
+    ids and the cursor is the oldest transaction still running, so an entry
+    can't show up behind a cursor once it has been handed out.
+    """
+    if _commit_ordered_ids(session):
+        return (session.exec(select(func.max(ChangeLog.id))).one() or 0) + 1
+    return session.exec(select(func.txid_snapshot_xmin(func.txid_current_snapshot()))).one()
+
+
+def log_between(session: Session, since: int, cursor: int, limit: Optional[int] = None):
+    # In id order: two writes to the same row get their ids in the order they
+    # took the row lock, so the last one wins here too
+    position = _position(session)
+    query = select(ChangeLog).where(position >= since, position < cursor).order_by(ChangeLog.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return session.exec(query).all()
+
+
+def changes_since(session: Session, since: int, cursor: int):
+    """Collapse the change log between `since` and `cursor` into the latest op per row.
+
+    Returns None if a reset happened in that window and the client has to
+    start over with a full snapshot.
+    """
+    latest = {}
+    entries = log_between(session, since, cursor)
+    for entry in entries:
+        if entry.op == OP_RESET:
+            return None
+        latest[(entry.table_name, entry.row_id)] = entry.op
+
+    upserts = {name: [] for name in TRACKED_TABLES}
+    deletes = {name: [] for name in TRACKED_TABLES}
+    for (table_name, row_id), op in latest.items():
+        if table_name in TRACKED_TABLES:
+            (upserts if op == OP_UPSERT else deletes)[table_name].append(row_id)
+    return upserts, deletes
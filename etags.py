@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Optional
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+
+from database import engine, read_engine, reads_from_replica
+from models import ChangeLog
+
+# How long a worker trusts its cached table versions before re-reading them.
+# Writes made by this worker invalidate immediately; the TTL only bounds how
+# long a change committed by *another* worker can go unnoticed.
+ETAG_VERSION_TTL = float(os.getenv("ETAG_VERSION_TTL", "2"))
+
+
+class TableVersions:
+    """Per-table data versions (the latest change_log id for that table)."""
+
+    def __init__(self, ttl: float, bind=engine):
+        self.ttl = ttl
+        self.bind = bind
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._fetched_at = 0.0
+
+    def get(self, table_name: str, session: Optional[Session] = None) -> int:
+        """Cached version of `table_name`.
+
+        A miss is read through `session` when given (one bound to the same
+        database), so a handler running on the async engine doesn't block
+        the event loop on a connection of its own.
+        """
+        with self._lock:
+            if time.monotonic() - self._fetched_at > self.ttl:
+                self._versions = {}
+            if table_name in self._versions:
+                return self._versions[table_name]
+        if session is None:
+            with Session(self.bind) as own_session:
+                version = self._read(own_session, table_name)
+        else:
+            version = self._read(session, table_name)
+        with self._lock:
+            if not self._versions:
+                self._fetched_at = time.monotonic()
+            self._versions[table_name] = version
+        return version
+
+    @staticmethod
+    def _read(session: Session, table_name: str) -> int:
+        return session.exec(select(func.max(ChangeLog.id)).where(ChangeLog.table_name == table_name)).one() or 0
+
+    def invalidate(self):
+        with self._lock:
+            self._versions = {}
+
+
+table_versions = TableVersions(ETAG_VERSION_TTL)
+# Writes land on the primary, so replica versions only ever age out by TTL
+replica_versions = TableVersions(ETAG_VERSION_TTL, read_engine) if read_engine is not None else None
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _invalidate_on_commit(session):
+    # changes.py flags sessions that wrote change_log entries
+    if session.info.get("logged_changes"):
+        table_versions.invalidate()
+
+
+def data_versions(request: Request, *table_names: str) -> str:
+    """Versions of `table_names` for this request, read once per request.
+
+    The ETag is built from them, and handlers that answer from a cache key
+    it by them too, so a tag is never sent with a body older than it.
+    """
+    seen = getattr(request.state, "data_versions", None)
+    if seen is None:
+        seen = request.state.data_versions = {}
+    if table_names not in seen:
+        # Versions from the database the request reads, so a lagging replica
+        # never serves old rows under a newer tag
+        source = replica_versions if reads_from_replica(request) else table_versions
+        seen[table_names] = ".".join(str(source.get(name)) for name in table_names)
+    return seen[table_names]
+
+
+def make_etag(request: Request, *table_names: str) -> str:
+    versions = data_versions(request, *table_names)
+    # Different filters/pages of the same table need different tags, and so
+    # does the same URL for users limited to different warehouses
+    user = getattr(request.state, "user", None) or {}
+    query = hashlib.sha1(f"{request.query_params}|{user.get('warehouse_id')}".encode()).hexdigest()[:12]
+    return f'"{"-".join(table_names)}.{versions}.{query}"'
+
+
+def conditional(*table_names: str):
+    """Dependency that answers 304 when the client's copy is still current."""
+
+    def dependency(request: Request, response: Response):
+        etag = make_etag(request, *table_names)
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            raise HTTPException(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+        return etag
+
+    return dependency
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import event
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from database import engine
+from models import UserRead
+from changes import TRACKED_TABLES, OP_UPSERT, current_cursor, log_between
+
+# Recent events kept for Last-Event-ID resume
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "1000"))
+# How often a worker checks the change log for writes made by *other*
+# workers; its own commits are picked up immediately.
+EVENT_POLL_INTERVAL = float(os.getenv("EVENT_POLL_INTERVAL", "1"))
+EVENT_HEARTBEAT_INTERVAL = float(os.getenv("EVENT_HEARTBEAT_INTERVAL", "15"))
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+RESET = object()  # queued to a subscriber that can no longer be caught up
+
+
+class EventBroker:
+    """In-process pub/sub fed from the change_log table.
+
+    Event ids are change_log cursors (see changes.current_cursor), sent
+    after each batch, so they mean the same thing in every gunicorn worker
+    and in /api/sync, and a client can resume on whichever worker it reaches.
+    All state is touched only from the event loop.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.buffer = deque(maxlen=buffer_size)  # (position, table_name, payload, warehouse_id)
+        self.floor = 0  # every event at or after floor and before cursor is in the buffer
+        self.cursor = 0
+        self.subscribers = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake = None
+        self._task = None
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.floor = self.cursor = await run_in_threadpool(self._current_cursor)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def notify(self):
+        """Thread-safe: wake the poller after a local commit."""
+        if self.loop is not None and self._wake is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    @staticmethod
+    def _current_cursor():
+        with Session(engine) as session:
+            return current_cursor(session)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=EVENT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self._poll()
+            except Exception as e:
+                print(f"Event poll failed: {e}")
+
+    async def _poll(self):
+        # Polling even with no subscribers keeps the buffer complete for
+        # resumes; it is one indexed range query that is usually empty.
+        events, cursor, overflow = await run_in_threadpool(self._load_events, self.cursor)
+        if overflow:
+            # Too many changes at once to buffer: everyone has to resync
+            self.buffer.clear()
+            self.floor = self.cursor = cursor
+            for queue in list(self.subscribers):
+                self._reset_subscriber(queue)
+            return
+        self.cursor = max(self.cursor, cursor)
+        if not events:
+            return
+        for item in events:
+            self._append(item)
+        for item in (*events, self.cursor):
+            for queue in list(self.subscribers):
+                try:
+                    queue.put_nowait(item)
+                except asyncio.QueueFull:
+                    self._reset_subscriber(queue)
+
+    def _reset_subscriber(self, queue):
+        self.subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESET)
+
+    def _append(self, item):
+        if len(self.buffer) == self.buffer.maxlen:
+            # A batch is in id order, not position order: keep the highest
+            self.floor = max(self.floor, self.buffer[0][0] + 1)
+        self.buffer.append(item)
+
+    def _load_events(self, since: int):
+        """Events between `since` and the current cursor, and that cursor."""
+        with Session(engine) as session:
+            cursor = current_cursor(session)
+            entries = log_between(session, since, cursor, limit=self.buffer.maxlen + 1)
+            if len(entries) > self.buffer.maxlen:
+                return [], cursor, True
+            # Attach current row data so dashboards don't have to refetch
+            rows = {}
+            for table_name, model in TRACKED_TABLES.items():
+                ids = {e.row_id for e in entries if e.table_name == table_name and e.op == OP_UPSERT}
+                if ids:
+                    for row in session.exec(select(model).where(model.id.in_(ids))):
+                        if table_name == "users":
+                            row = UserRead.model_validate(row, from_attributes=True)
+                        rows[(table_name, row.id)] = jsonable_encoder(row)
+            events = []
+            for entry in entries:
+                payload = {"op": entry.op, "id": entry.row_id}
+                row = rows.get((entry.table_name, entry.row_id))
+                if row is not None:
+                    payload["row"] = row
+                # Activities belong to one warehouse, as in /api/sync; deletes
+                # carry no row (only the id) and go to everyone
+                warehouse_id = row["warehouse_id"] if row is not None and entry.table_name == "activities" else None
+                position = entry.id if entry.txid is None else entry.txid
+                events.append((position, entry.table_name, json.dumps(payload), warehouse_id))
+            return events, cursor, False
+
+    def subscribe(self, last_event_id: Optional[int] = None):
+        """Register a subscriber, pre-filled with anything it missed.
+
+        The queue carries event tuples, then the cursor (an int) once the
+        batch they belong to is complete.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        if last_event_id is not None:
+            if last_event_id < self.floor:
+                queue.put_nowait(RESET)
+                return queue
+            for item in self.buffer:
+                if item[0] >= last_event_id:
+                    queue.put_nowait(item)
+        queue.put_nowait(self.cursor)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+
+broker = EventBroker()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish_on_commit(session):
+    # changes.py flags sessions that wrote change_log entries
+    if session.info.get("logged_changes"):
+        broker.notify()
+
+
+def format_event(item) -> str:
+    _, table_name, payload, _ = item
+    return f"event: {table_name}\ndata: {payload}\n\n"
+
+
+def in_scope(item, warehouse_id: Optional[int]) -> bool:
+    # Same rule as inventory.in_warehouse: no warehouse means all of them
+    return warehouse_id is None or item[3] is None or item[3] == warehouse_id
+
+
+async def event_stream(request, last_event_id: Optional[int], warehouse_id: Optional[int] = None):
+    queue = broker.subscribe(last_event_id)
+    # Another worker may have been further ahead: don't go back behind it
+    resume = last_event_id or 0
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=EVENT_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            if item is RESET:
+                # Too far behind to replay: the client should call /api/sync
+                yield "event: reset\ndata: {}\n\n"
+                break
+            if isinstance(item, int):
+                # An id-only message moves the browser's Last-Event-ID to the
+                # end of the batch; a drop mid-batch replays just that batch
+                if item > resume:
+                    resume = item
+                    yield f"id: {item}\n\n"
+            elif item[0] >= resume and in_scope(item, warehouse_id):
+                yield format_event(item)
+    finally:
+        broker.unsubscribe(queue)
@@ -0,0 +1,328 @@
+from datetime import datetime, date
+from typing import Optional, Tuple
+from sqlmodel import Session, select
+from sqlalchemy import case, delete, func, insert, or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import Item, Activity, ActivityArchive, StockBalance, DailyMovement, InventorySnapshot
+
+# Action strings look like "Geliyay: 15000 English Grade 7" (inbound)
+# or "Bixiyay: 3 Laptop" (outbound). Activity.direction stores "in"/"out".
+ACTION_IN = "Geliyay"
+ACTION_OUT = "Bixiyay"
+DIRECTION_IN = "in"
+DIRECTION_OUT = "out"
+DIRECTIONS = {ACTION_IN: DIRECTION_IN, ACTION_OUT: DIRECTION_OUT}
+
+
+def parse_movement(action: str) -> Optional[Tuple[str, int, str]]:
+    """Split an action string into (direction, quantity, item name)."""
+    parts = (action or "").split(": ", 1)
+    if len(parts) < 2 or parts[0] not in DIRECTIONS:
+        return None
+    detail = parts[1].split(" ", 1)
+    try:
+        qty = int(detail[0])
+    except ValueError:
+        return None
+    item_name = detail[1] if len(detail) > 1 else ""
+    return DIRECTIONS[parts[0]], qty, item_name
+
+
+def parse_activity_date(value: str) -> Optional[date]:
+    # Stored as dd/mm/yyyy by the dashboard; accept ISO yyyy-mm-dd as well
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime((value or "").strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def item_index(session: Session):
+    """({name: id}, {(name, category): id}) for resolving many movements with one query.
+
+    Picks like populate_movement: the item in the entry's category, else the oldest.
+    """
+    by_name = {}
+    by_name_category = {}
+    for item_id, name, category in session.exec(select(Item.id, Item.name, Item.category).order_by(Item.id)):
+        by_name.setdefault(name, item_id)
+        by_name_category.setdefault((name, category), item_id)
+    return by_name, by_name_category
+
+
+def populate_movement(session: Session, activity: Activity, index=None):
+    """Fill the structured direction/quantity/item_id/item_name columns from the action text.
+
+    Whatever the client sent in those columns is replaced: the action text
+    is what was approved, and the ledger and reports read the columns.
+    Batch callers pass an `item_index` so no row needs its own item query.
+    """
+    movement = parse_movement(activity.action)
+    activity.direction, activity.quantity, activity.item_name = movement or (None, None, None)
+    activity.item_id = None
+    if not movement:
+        return
+    if index is not None:
+        by_name, by_name_category = index
+        activity.item_id = by_name_category.get((activity.item_name, activity.item_category)) or by_name.get(activity.item_name)
+        return
+    statement = select(Item.id).where(Item.name == activity.item_name)
+    if activity.item_category:
+        statement = statement.order_by((Item.category == activity.item_category).desc())
+    activity.item_id = session.exec(statement.order_by(Item.id)).first()
+
+
+def populate_activity_date(activity: Activity):
+    if activity.activity_date is None:
+        activity.activity_date = parse_activity_date(activity.date)
+
+
+def counts_toward_stock(status: Optional[str]) -> bool:
+    # Same rule as the dashboard: only 'Approved' (or legacy rows without a status)
+    return not status or status == "Approved"
+
+
+def signed_quantity(activity: Activity) -> Optional[Tuple[str, int]]:
+    """Return (item name, signed delta) for a movement, or None if unparseable."""
+    movement = parse_movement(activity.action)
+    if not movement:
+        return None
+    direction, qty, item_name = movement
+    # From the text, like populate_movement, so the typed columns can't disagree
+    return item_name, qty if direction == DIRECTION_IN else -qty
+
+
+def resolve_category(session: Session, activity: Activity, item_name: str) -> str:
+    if activity.item_category:
+        return activity.item_category
+    item = session.exec(select(Item).where(Item.name == item_name)).first()
+    return item.category if item else "General"
+
+
+def in_warehouse(column, warehouse_id: Optional[int]):
+    """Criteria limiting `column` to one warehouse; none for every warehouse."""
+    return [column == warehouse_id] if warehouse_id is not None else []
+
+
+def _upsert(session: Session, model):
+    # INSERT ... ON CONFLICT, which SQLite and PostgreSQL spell the same way
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def adjust_balance(session: Session, warehouse_id: int, item_name: str, category: str, delta: int):
+    # One atomic increment-or-insert, so concurrent writers neither overwrite
+    # each other nor both insert the first row for a new item
+    statement = _upsert(session, StockBalance).values(
+        warehouse_id=warehouse_id, item_name=item_name, category=category, quantity=delta, updated_at=datetime.utcnow(),
+    )
+    session.execute(statement.on_conflict_do_update(
+        index_elements=["warehouse_id", "item_name", "category"],
+        set_={"quantity": StockBalance.quantity + statement.excluded.quantity, "updated_at": statement.excluded.updated_at},
+    ))
+
+
+def adjust_daily_movement(session: Session, warehouse_id: int, movement_date: date, item_name: str, category: str, direction: str, delta: int):
+    # Same upsert as adjust_balance, one row per warehouse/day/item/direction
+    statement = _upsert(session, DailyMovement).values(
+        warehouse_id=warehouse_id, movement_date=movement_date, item_name=item_name,
+        category=category, direction=direction, quantity=delta,
+    )
+    session.execute(statement.on_conflict_do_update(
+        index_elements=["warehouse_id", "movement_date", "item_name", "category", "direction"],
+        set_={"quantity": DailyMovement.quantity + statement.excluded.quantity},
+    ))
+
+
+def _direction(delta: int) -> str:
+    return DIRECTION_IN if delta > 0 else DIRECTION_OUT
+
+
+def invalidate_snapshots(session: Session, activity_dates):
+    """Drop snapshots that a movement dated on/before them has made stale.
+
+    Every warehouse's rows go: a checkpoint date is shared by all of them.
+    """
+    # Snapshots only cover closed days, so today's entries never touch them
+    dates = [d for d in activity_dates if d is not None and d < date.today()]
+    if dates:
+        session.execute(delete(InventorySnapshot).where(InventorySnapshot.snapshot_date >= min(dates)))
+
+
+def _apply_movement(session: Session, activity: Activity, sign: int):
+    movement = signed_quantity(activity)
+    if not movement:
+        return
+    item_name, delta = movement
+    category = resolve_category(session, activity, item_name)
+    adjust_balance(session, activity.warehouse_id, item_name, category, sign * delta)
+    if activity.activity_date is not None:
+        adjust_daily_movement(session, activity.warehouse_id, activity.activity_date, item_name, category, _direction(delta), sign * abs(delta))
+    invalidate_snapshots(session, [activity.activity_date])
+
+
+def apply_activity(session: Session, activity: Activity, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) an activity's effect on the balances.
+
+    Must be called inside the caller's transaction, before commit.
+    """
+    if counts_toward_stock(activity.status):
+        _apply_movement(session, activity, sign)
+
+
+def apply_activities(session: Session, activities):
+    """Bulk form of apply_activity: one balance update per warehouse and item."""
+    apply_movements(session, [(activity, 1) for activity in activities if counts_toward_stock(activity.status)])
+
+
+def apply_movements(session: Session, movements):
+    """Apply (activity, sign) pairs regardless of status, aggregated per warehouse and item."""
+    categories = item_categories(session)
+    totals = {}
+    daily = {}
+    for activity, sign in movements:
+        movement = signed_quantity(activity)
+        if not movement:
+            continue
+        item_name, delta = movement
+        key = (activity.warehouse_id, item_name, activity.item_category or categories.get(item_name) or "General")
+        totals[key] = totals.get(key, 0) + sign * delta
+        if activity.activity_date is not None:
+            day_key = (activity.activity_date, *key, _direction(delta))
+            daily[day_key] = daily.get(day_key, 0) + sign * abs(delta)
+    for (warehouse_id, item_name, category), delta in totals.items():
+        if delta:
+            adjust_balance(session, warehouse_id, item_name, category, delta)
+    for (movement_date, warehouse_id, item_name, category, direction), delta in daily.items():
+        if delta:
+            adjust_daily_movement(session, warehouse_id, movement_date, item_name, category, direction, delta)
+    invalidate_snapshots(session, [activity.activity_date for activity, sign in movements])
+
+
+def apply_status_change(session: Session, activity: Activity, old_status: Optional[str]):
+    was_counted = counts_toward_stock(old_status)
+    is_counted = counts_toward_stock(activity.status)
+    if was_counted != is_counted:
+        _apply_movement(session, activity, 1 if is_counted else -1)
+
+
+def item_categories(session: Session):
+    return {name: category for name, category in session.exec(select(Item.name, Item.category))}
+
+
+def archive_cutoff(session: Session) -> Optional[date]:
+    """Last day whose activities were moved out to the archive, if any."""
+    return session.exec(select(func.max(ActivityArchive.period_end))).one()
+
+
+def archived_balances(session: Session):
+    # Archived movements live on as the snapshot taken at the cutoff
+    cutoff = archive_cutoff(session)
+    if cutoff is None:
+        return {}
+    rows = session.exec(
+        select(InventorySnapshot.warehouse_id, InventorySnapshot.item_name, InventorySnapshot.category, InventorySnapshot.quantity)
+        .where(InventorySnapshot.snapshot_date == cutoff)
+    )
+    return {(warehouse_id, name, category): quantity for warehouse_id, name, category, quantity in rows}
+
+
+def rebuild_balances(session: Session):
+    """Recompute every balance by replaying the activity history.
+
+    Archived periods are not replayed; their totals come from the
+    checkpoint snapshot at the archive cutoff.
+    """
+    session.execute(delete(StockBalance))
+    totals = archived_balances(session)
+    categories = item_categories(session)
+    for activity in session.exec(select(Activity)):
+        if not counts_toward_stock(activity.status):
+            continue
+        movement = signed_quantity(activity)
+        if not movement:
+            continue
+        item_name, delta = movement
+        category = activity.item_category or categories.get(item_name) or "General"
+        key = (activity.warehouse_id, item_name, category)
+        totals[key] = totals.get(key, 0) + delta
+    for (warehouse_id, item_name, category), qty in totals.items():
+        session.add(StockBalance(warehouse_id=warehouse_id, item_name=item_name, category=category, quantity=qty))
+    session.commit()
+
+
+def rebuild_daily_movements(session: Session):
+    """Recompute the daily_movement rollup from the activity history."""
+    # Days that were archived can't be replayed; keep their rollup rows
+    cutoff = archive_cutoff(session)
+    session.execute(delete(DailyMovement).where(*([DailyMovement.movement_date > cutoff] if cutoff else [])))
+    categories = item_categories(session)
+    totals = {}
+    # Plain rows (not ORM objects): signed_quantity only reads the action
+    rows = session.execute(
+        select(Activity.activity_date, Activity.warehouse_id, Activity.action, Activity.status, Activity.item_category)
+        .where(Activity.activity_date != None)  # noqa: E711
+        .execution_options(yield_per=1000)
+    )
+    for row in rows:
+        if not counts_toward_stock(row.status):
+            continue
+        movement = signed_quantity(row)
+        if not movement:
+            continue
+        item_name, delta = movement
+        key = (row.activity_date, row.warehouse_id, item_name, row.item_category or categories.get(item_name) or "General", _direction(delta))
+        totals[key] = totals.get(key, 0) + abs(delta)
+    if totals:
+        session.execute(insert(DailyMovement), [
+            {
+                "movement_date": movement_date, "warehouse_id": warehouse_id, "item_name": item_name,
+                "category": category, "direction": direction, "quantity": quantity,
+            }
+            for (movement_date, warehouse_id, item_name, category, direction), quantity in totals.items()
+        ])
+    session.commit()
+
+
+def movement_totals(*criteria):
+    """Statement summing approved movements per (warehouse id, item name, category).
+
+    Keyed by the item name from the action text, like the ledger, so items
+    missing from the catalogue keep their own rows. Extra criteria narrow
+    the activities (date range, user, warehouse, ...).
+    """
+    signed = case((Activity.direction == DIRECTION_IN, Activity.quantity), else_=-Activity.quantity)
+    category = func.coalesce(Activity.item_category, Item.category, "General")
+    total = func.sum(signed)
+    return (
+        select(Activity.warehouse_id, Activity.item_name, category, total)
+        .select_from(Activity)
+        .join(Item, Item.id == Activity.item_id, isouter=True)
+        # Like signed_quantity, rows whose action doesn't parse count for nothing
+        .where(or_(Activity.status == None, Activity.status == "Approved"), Activity.quantity != None, Activity.item_name != None)  # noqa: E711
+        .where(*criteria)
+        .group_by(Activity.warehouse_id, Activity.item_name, category)
+    )
+
+
+def totals_by_item(totals):
+    """Collapse {(warehouse id, name, category): qty} to sorted (name, category, qty) rows."""
+    by_item = {}
+    for (warehouse_id, name, category), quantity in totals.items():
+        by_item[(name, category)] = by_item.get((name, category), 0) + (quantity or 0)
+    return sorted(
+        ((name, category, quantity) for (name, category), quantity in by_item.items() if quantity),
+        key=lambda row: (row[1], row[0]),
+    )
+
+
+def ensure_balances(session: Session):
+    # Existing deployments start with empty balance/rollup tables; fill them once.
+    if session.exec(select(Activity)).first() is None:
+        return
+    if session.exec(select(StockBalance)).first() is None:
+        rebuild_balances(session)
+    if session.exec(select(DailyMovement)).first() is None:
+        rebuild_daily_movements(session)
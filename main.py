@@ -1,21 +1,46 @@
 import uvicorn
 import os
 import sys
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from sqlalchemy import func
 from sqlmodel import SQLModel, Session, select
 
 # Ensure backend folder is in sys.path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from database import engine, get_session, create_db_and_tables
-from models import User, Item, Activity
-from auth import verify_password, get_password_hash, create_access_token
+from database import (
+    engine, async_engine, read_engine, get_session, get_read_session, get_db_session, read_bind, run_db, async_endpoint,
+    dispose_async_engine, create_db_and_tables, optimize_database, get_pool_stats, ReadYourWritesMiddleware,
+)
+from models import User, UserRead, Warehouse, Item, Activity, ActivityArchive, StockBalance
+from inventory import apply_activity, apply_status_change, apply_movements, archive_cutoff, counts_toward_stock, ensure_balances, in_warehouse, populate_movement, populate_activity_date
+from migrations import run_migrations
+from pagination import paginate, page_limit, row_response, fast_json, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+from changes import TRACKED_TABLES, current_cursor, changes_since
+from etags import conditional, data_versions
+from cache import reference_cache
+from reports import REPORT_TYPES, REPORT_TITLES, report_rows, stream_csv, stream_xlsx
+from bulk import run_import, MAX_BULK_ROWS
+from assets import asset_manifest, asset_response
+from events import broker, event_stream
+from snapshots import snapshot_job, stock_at
+from archive import archives_between, missing_files, stream_archive
+from stats import dashboard_stats, MAX_TREND_DAYS
+from search import search_items, MAX_SEARCH_LIMIT
+from metrics import MetricsMiddleware, instrument_engine, metrics
+from warehouses import (
+    list_warehouses, known_warehouse, invalidate_warehouses, populate_warehouse, warehouse_scope, check_warehouse,
+    transfer_legs, transfer_partners,
+)
+from security import authenticate, require_roles, require_metrics_access, current_user, revoke_tokens, ADMIN_ROLES, APPROVER_ROLES
+from auth import ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash, create_access_token, password_fingerprint, verify_password_async, get_password_hash_async, get_password_hashes_async, hashing_stats, shutdown_hash_pool
 
-app = FastAPI(title="Warehouse Management API")
+# Every /api route except login needs a bearer token, see security.py
+app = FastAPI(title="Warehouse Management API", dependencies=[Depends(authenticate)])
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -24,12 +49,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
 
+# Per-route latency, status and SQL counts for /metrics
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine)
+if read_engine is not None:
+    instrument_engine(read_engine)
+
+# Keeps a client's reads off the replica until its own writes have replicated
+app.add_middleware(ReadYourWritesMiddleware)
+
 @app.on_event("startup")
 def on_startup():
     from sqlalchemy import text
+    asset_manifest.build(static_dir)
     create_db_and_tables()
+    run_migrations(engine)
     with Session(engine) as session:
         # 1. Seed Users (if none exist)
         if not session.exec(select(User)).first():
@@ -45,6 +84,43 @@ def on_startup():
 
         # 2. Data persistence is now preserved.
 
+        # 3. Build stock balances for databases that predate the ledger
+        ensure_balances(session)
+
+    # 4. Planner statistics for the new indexes (SQLite only)
+    optimize_database()
+
+@app.on_event("startup")
+async def start_event_broker():
+    await broker.start()
+    await snapshot_job.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    shutdown_hash_pool()
+
+@app.on_event("shutdown")
+async def stop_event_broker():
+    await broker.stop()
+    await snapshot_job.stop()
+    await dispose_async_engine()
+
+
+# --- Metrics ---
+# Registered before the static catch-all route below
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+def prometheus_metrics():
+    pool = get_pool_stats()
+    cache = reference_cache.stats()
+    extra = {
+        "db_pool_checked_out": ("gauge", "Connections currently checked out.", pool.get("checked_out", 0)),
+        "db_pool_wait_seconds_total": ("counter", "Time spent waiting for a pooled connection.", pool["wait_total_ms"] / 1000),
+        "db_pool_timeouts_total": ("counter", "Checkouts that timed out waiting for a connection.", pool["timeouts"]),
+        "cache_hits_total": ("counter", "Reference cache hits.", cache["hits"]),
+        "cache_misses_total": ("counter", "Reference cache misses.", cache["misses"]),
+        "event_subscribers": ("gauge", "Open /api/events streams.", len(broker.subscribers)),
+    }
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
 
 # --- Serve Static Files ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -55,131 +131,510 @@ else:
     # Nested structure (Local backend folder)
     static_dir = os.path.abspath(os.path.join(current_dir, ".."))
 
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# Files are read, fingerprinted and precompressed once at startup (assets.py);
+# pages reference subresources as /assets/<name>.<hash>.<ext>.
+def _serve_asset(request: Request, filename: str):
+    asset = asset_manifest.by_name.get(filename)
+    if not asset:
+        raise HTTPException(status_code=404)
+    return asset_response(request, asset, immutable=False)
+
+@app.get("/assets/{fingerprinted}")
+def read_asset(fingerprinted: str, request: Request):
+    asset = asset_manifest.by_fingerprint.get(fingerprinted)
+    if not asset:
+        raise HTTPException(status_code=404)
+    return asset_response(request, asset, immutable=True)
 
 @app.get("/")
-def read_index():
-    return FileResponse(os.path.join(static_dir, "index.html"))
+def read_index(request: Request):
+    return _serve_asset(request, "index.html")
 
 @app.get("/login")
-def read_login():
-    return FileResponse(os.path.join(static_dir, "login.html"))
+def read_login(request: Request):
+    return _serve_asset(request, "login.html")
 
-# Special case for other top-level files if needed, but mount /static covers assets
+@app.get("/static/{filename}")
+def read_static(filename: str, request: Request):
+    return _serve_asset(request, filename)
+
+# Special case for other top-level files (login.html, unfingerprinted assets)
 @app.get("/{filename}")
-def read_file(filename: str):
-    file_path = os.path.join(static_dir, filename)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return FileResponse(file_path)
-    raise HTTPException(status_code=404)
+def read_file(filename: str, request: Request):
+    return _serve_asset(request, filename)
 
 # --- Auth Endpoints ---
+def find_user(session: Session, username: str) -> Optional[dict]:
+    # Cached as a plain dict; unknown usernames are not cached
+    def load():
+        user = session.exec(select(User).where(User.username == username)).first()
+        return user.model_dump() if user else None
+    return reference_cache.get_or_load(("user", username), load)
+
+def invalidate_users():
+    reference_cache.invalidate("user", "users")
+
+# Handlers that hash passwords are async: hashing runs in the process pool
+# from auth.py and session calls go through run_db (threadpool or async engine).
 @app.post("/api/login")
-def login(data: dict, session: Session = Depends(get_session)):
+async def login(data: dict, session: Session = Depends(get_db_session)):
     username = data.get("username")
     password = data.get("password")
     
-    statement = select(User).where(User.username == username)
-    user = session.exec(statement).first()
+    user = await run_db(session, find_user, username)
     
-    if not user or not verify_password(password, user.password_hash):
+    # Disabled accounts would be turned away by every other endpoint anyway
+    if not user or user["status"] != "Active" or not await verify_password_async(password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid username or password")
     
-    access_token = create_access_token(data={"sub": user.username, "role": user.role})
+    access_token = create_access_token(
+        data={"sub": user["username"], "role": user["role"], "pwd": password_fingerprint(user["password_hash"])},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
     return {
         "access_token": access_token,
         "token_type": "bearer",
         "user": {
-            "name": user.name,
-            "role": user.role,
-            "username": user.username
+            "name": user["name"],
+            "role": user["role"],
+            "username": user["username"]
         }
     }
 
 # --- Inventory Endpoints ---
-@app.get("/api/items", response_model=List[Item])
-def get_items(session: Session = Depends(get_session)):
-    return session.exec(select(Item)).all()
+@app.get("/api/items", response_model=List[Item], dependencies=[Depends(conditional("items"))])
+@async_endpoint
+def get_items(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=0, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    session: Session = Depends(get_session),
+):
+    limit = page_limit(limit)
+    # Stays on the primary: a lagging replica would refill the shared cache with old rows
+    if cursor is None and limit is None and fields is None:
+        items = reference_cache.get_or_load(
+            # Keyed by the ETag's version: a newer tag never gets an older list
+            ("items", "all", data_versions(request, "items")),
+            # Plain rows: dicts keyed in field order, as FAST_JSON sends them
+            lambda: [dict(row) for row in session.execute(select(*Item.__table__.columns).order_by(Item.id)).mappings()],
+        )
+        # The cached dicts are already response-shaped
+        return row_response(items, response) if fast_json else items
+    return paginate(session, Item, response, cursor=cursor, limit=limit, fields=fields)
+
+@app.get("/api/items/search")
+@async_endpoint
+def search_items_endpoint(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT),
+    session: Session = Depends(get_read_session),
+):
+    # Typeahead for the item picker: prefix, substring and misspellings, ranked
+    return search_items(session, q, limit)
 
 @app.post("/api/items", response_model=Item)
+@async_endpoint
 def create_item(item: Item, session: Session = Depends(get_session)):
     session.add(item)
     session.commit()
     session.refresh(item)
+    reference_cache.invalidate("items")
     return item
 
-@app.get("/api/seed-autism")
+def _bulk_rows(data: dict, key: str) -> List[dict]:
+    rows = data.get(key)
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail=f"'{key}' must be a list")
+    if len(rows) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} rows per batch")
+    return rows
+
+@app.post("/api/items/bulk")
+@async_endpoint
+def create_items_bulk(data: dict, session: Session = Depends(get_session)):
+    result = run_import(session, "items", _bulk_rows(data, "items"), data.get("batch_key"))
+    reference_cache.invalidate("items")
+    return result
+
+@app.get("/api/seed-autism", dependencies=[Depends(require_roles(*ADMIN_ROLES))])
 def seed_autism():
     try:
         from seed_autism_data import seed_autism_data
         seed_autism_data()
+        reference_cache.invalidate("items")
         return {"status": "success", "message": "Autism equipment data seeded successfully"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 # --- Activity Endpoints ---
-@app.get("/api/activities", response_model=List[Activity])
-def get_activities(session: Session = Depends(get_session)):
-    return session.exec(select(Activity)).all()
+@app.get("/api/activities", response_model=List[Activity], dependencies=[Depends(conditional("activities"))])
+@async_endpoint
+def get_activities(
+    response: Response,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=0, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    warehouse_id: Optional[int] = Depends(warehouse_scope),
+    session: Session = Depends(get_read_session),
+):
+    limit = page_limit(limit)
+    criteria = in_warehouse(Activity.warehouse_id, warehouse_id)
+    if start:
+        criteria.append(Activity.activity_date >= start)
+    if end:
+        criteria.append(Activity.activity_date <= end)
+    if user:
+        criteria.append(Activity.user == user)
+    if status:
+        criteria.append(Activity.status == status)
+    return paginate(session, Activity, response, *criteria, cursor=cursor, limit=limit, fields=fields)
+
+@app.get("/api/activities/archive")
+def read_activity_archive(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user: Optional[str] = None,
+    warehouse_id: Optional[int] = Depends(warehouse_scope),
+    session: Session = Depends(get_read_session),
+):
+    # Periods moved out by archive.py, as NDJSON (one activity per line)
+    archives = archives_between(session, start, end)
+    missing = missing_files(archives)
+    if missing:
+        raise HTTPException(status_code=503, detail=f"Archive files not found: {missing}")
+    return StreamingResponse(stream_archive(archives, start, end, user, warehouse_id), media_type="application/x-ndjson")
+
+@app.get("/api/activities/archive/periods", response_model=List[ActivityArchive], dependencies=[Depends(conditional("activities"))])
+def list_activity_archives(session: Session = Depends(get_read_session)):
+    return archives_between(session)
 
 @app.post("/api/activities", response_model=Activity)
-def create_activity(activity: Activity, session: Session = Depends(get_session)):
+@async_endpoint
+def create_activity(activity: Activity, request: Request, session: Session = Depends(get_session)):
+    # Storekeepers submit requests; only approvers record movements directly
+    user = current_user(request)
+    if user["role"] not in APPROVER_ROLES and activity.status != "Pending":
+        raise HTTPException(status_code=403, detail="Storekeepers can only submit Pending requests")
+    # Ids are the server's; only POST /api/transfers links legs together
+    activity.id = None
+    activity.transfer_id = None
+    # Regional staff book into their own warehouse
+    if activity.warehouse_id is None:
+        activity.warehouse_id = user["warehouse_id"]
+    check_warehouse(request, activity.warehouse_id)
+    populate_warehouse(session, activity)
+    if not known_warehouse(session, activity.warehouse_id):
+        raise HTTPException(status_code=400, detail=f"Unknown warehouse {activity.warehouse_id}")
+    populate_movement(session, activity)
+    populate_activity_date(activity)
+    _check_not_archived(session, activity.activity_date)
     session.add(activity)
+    apply_activity(session, activity)
     session.commit()
     session.refresh(activity)
     return activity
 
-@app.patch("/api/activities/{activity_id}")
-def update_activity_status(activity_id: int, data: dict, session: Session = Depends(get_session)):
+def _check_not_archived(session: Session, activity_date: Optional[date]):
+    cutoff = archive_cutoff(session)
+    if cutoff and activity_date and activity_date <= cutoff:
+        raise HTTPException(status_code=409, detail=f"Activities up to {cutoff} are archived")
+
+@app.post("/api/transfers", response_model=List[Activity])
+@async_endpoint
+def create_transfer(data: dict, request: Request, session: Session = Depends(get_session)):
+    # Stock moved between warehouses: an outbound leg at the source and an
+    # inbound one at the destination, approved and deleted together
+    user = current_user(request)
+    leg_status = data.get("status", "Approved")
+    if user["role"] not in APPROVER_ROLES and leg_status != "Pending":
+        raise HTTPException(status_code=403, detail="Storekeepers can only submit Pending requests")
+    source = session.get(Warehouse, data.get("from_warehouse_id") or 0)
+    destination = session.get(Warehouse, data.get("to_warehouse_id") or 0)
+    if not source or not destination or source.id == destination.id:
+        raise HTTPException(status_code=400, detail="from_warehouse_id and to_warehouse_id must be two different warehouses")
+    check_warehouse(request, source.id)
+    quantity = data.get("quantity")
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0 or not data.get("item"):
+        raise HTTPException(status_code=400, detail="item and a positive integer quantity are required")
+
+    legs = transfer_legs(
+        source, destination, data["item"], quantity,
+        date=data.get("date") or date.today().strftime("%d/%m/%Y"),
+        item_category=data.get("item_category"),
+        user=data.get("user") or user["name"],
+        comment=data.get("comment"),
+        status=leg_status,
+    )
+    for leg in legs:
+        populate_movement(session, leg)
+        populate_activity_date(leg)
+        _check_not_archived(session, leg.activity_date)
+        session.add(leg)
+    session.flush()
+    for leg in legs:
+        leg.transfer_id = legs[0].id
+        apply_activity(session, leg)
+    session.commit()
+    for leg in legs:
+        session.refresh(leg)
+    return legs
+
+@app.post("/api/activities/bulk", dependencies=[Depends(require_roles(*APPROVER_ROLES))])
+@async_endpoint
+def create_activities_bulk(data: dict, request: Request, session: Session = Depends(get_session)):
+    rows = _bulk_rows(data, "activities")
+    warehouse_id = current_user(request)["warehouse_id"]
+    if warehouse_id is not None:
+        for row in rows:
+            if isinstance(row, dict):
+                row.setdefault("warehouse_id", warehouse_id)
+                check_warehouse(request, row["warehouse_id"])
+    return run_import(session, "activities", rows, data.get("batch_key"))
+
+@app.patch("/api/activities/{activity_id}", dependencies=[Depends(require_roles(*APPROVER_ROLES))])
+@async_endpoint
+def update_activity_status(activity_id: int, data: dict, request: Request, session: Session = Depends(get_session)):
     activity = session.get(Activity, activity_id)
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
+    legs = [activity, *transfer_partners(session, [activity])]
+    for leg in legs:
+        check_warehouse(request, leg.warehouse_id)
     
     if "status" in data:
-        activity.status = data["status"]
+        # Both legs of a transfer change together
+        for leg in legs:
+            old_status = leg.status
+            leg.status = data["status"]
+            apply_status_change(session, leg, old_status)
+            session.add(leg)
     
     session.add(activity)
     session.commit()
     session.refresh(activity)
     return activity
 
+# --- Approval Endpoints ---
+APPROVAL_STATUSES = ("Approved", "Rejected")
+MAX_APPROVAL_BATCH = 1000
+
+@app.get("/api/approvals", response_model=List[Activity], dependencies=[Depends(conditional("activities"))])
+@async_endpoint
+def get_approvals(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=0, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    warehouse_id: Optional[int] = Depends(warehouse_scope),
+    session: Session = Depends(get_read_session),
+):
+    # Served from the partial index on status = 'Pending'
+    return paginate(
+        session, Activity, response, Activity.status == "Pending", *in_warehouse(Activity.warehouse_id, warehouse_id),
+        cursor=cursor, limit=page_limit(limit), fields=fields,
+    )
+
+@app.get("/api/approvals/count", dependencies=[Depends(conditional("activities"))])
+@async_endpoint
+def count_approvals(warehouse_id: Optional[int] = Depends(warehouse_scope), session: Session = Depends(get_read_session)):
+    count = session.exec(
+        select(func.count()).select_from(Activity)
+        .where(Activity.status == "Pending", *in_warehouse(Activity.warehouse_id, warehouse_id))
+    ).one()
+    return {"pending": count}
+
+@app.post("/api/approvals/batch", dependencies=[Depends(require_roles(*APPROVER_ROLES))])
+@async_endpoint
+def batch_approvals(data: dict, request: Request, session: Session = Depends(get_session)):
+    new_status = data.get("status")
+    ids = data.get("ids")
+    if new_status not in APPROVAL_STATUSES:
+        raise HTTPException(status_code=400, detail="status must be Approved or Rejected")
+    if not isinstance(ids, list) or not ids:
+        raise HTTPException(status_code=400, detail="ids must be a non-empty list")
+    if not all(isinstance(activity_id, int) and not isinstance(activity_id, bool) for activity_id in ids):
+        raise HTTPException(status_code=400, detail="ids must be integers")
+    if len(ids) > MAX_APPROVAL_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_APPROVAL_BATCH} ids per batch")
+
+    activities = session.exec(select(Activity).where(Activity.id.in_(ids))).all()
+    missing = sorted(set(ids) - {activity.id for activity in activities})
+    if missing:
+        # All or nothing: nothing is changed if any id is unknown
+        raise HTTPException(status_code=404, detail=f"Activities not found: {missing}")
+    legs = [*activities, *transfer_partners(session, activities)]
+    for activity in legs:
+        check_warehouse(request, activity.warehouse_id)
+
+    movements = []
+    for activity in legs:
+        was_counted = counts_toward_stock(activity.status)
+        activity.status = new_status
+        if was_counted != counts_toward_stock(new_status):
+            movements.append((activity, 1 if not was_counted else -1))
+        session.add(activity)
+    apply_movements(session, movements)
+    session.commit()
+    return {"status": "success", "updated": len(activities), "new_status": new_status}
+
 @app.delete("/api/activities/{activity_id}")
-def delete_activity(activity_id: int, session: Session = Depends(get_session)):
+@async_endpoint
+def delete_activity(activity_id: int, request: Request, session: Session = Depends(get_session)):
     activity = session.get(Activity, activity_id)
     if not activity:
         raise HTTPException(status_code=404, detail="Activity not found")
+    # Same rule as the dashboard: approvers, or whoever entered it, and for
+    # a transfer on both legs since they are deleted together
+    user = current_user(request)
+    legs = [activity, *transfer_partners(session, [activity])]
+    for leg in legs:
+        if user["role"] not in APPROVER_ROLES and leg.user != user["name"]:
+            raise HTTPException(status_code=403, detail="Not allowed for your role")
+        check_warehouse(request, leg.warehouse_id)
     
-    session.delete(activity)
+    for leg in legs:
+        apply_activity(session, leg, -1)
+        session.delete(leg)
     session.commit()
     return {"status": "success", "message": "Activity deleted successfully"}
 
+@app.get("/api/inventory", response_model=List[StockBalance], dependencies=[Depends(conditional("activities"))])
+@async_endpoint
+def get_inventory(warehouse_id: Optional[int] = Depends(warehouse_scope), session: Session = Depends(get_read_session)):
+    # One row per warehouse and item; ?warehouse_id= reads only that warehouse's rows
+    statement = (
+        select(StockBalance)
+        .where(*in_warehouse(StockBalance.warehouse_id, warehouse_id))
+        .order_by(StockBalance.category, StockBalance.item_name, StockBalance.warehouse_id)
+    )
+    return session.exec(statement).all()
+
+# No ETag: "today" moves at midnight without any write to the change log
+@app.get("/api/stats")
+@async_endpoint
+def get_stats(
+    days: int = Query(7, ge=1, le=MAX_TREND_DAYS),
+    warehouse_id: Optional[int] = Depends(warehouse_scope),
+    session: Session = Depends(get_read_session),
+):
+    # Today's in/out, low stock and an N-day trend from the daily_movement rollup
+    return dashboard_stats(session, days, warehouse_id=warehouse_id)
+
+@app.get("/api/inventory/as-of/{as_of}", dependencies=[Depends(conditional("activities"))])
+@async_endpoint
+def get_inventory_as_of(as_of: date, warehouse_id: Optional[int] = Depends(warehouse_scope), session: Session = Depends(get_read_session)):
+    # Nearest snapshot plus later movements, see snapshots.py
+    return [
+        {"item_name": name, "category": category, "quantity": quantity}
+        for name, category, quantity in stock_at(session, as_of, warehouse_id)
+    ]
+
+# --- Warehouse Endpoints ---
+@app.get("/api/warehouses", response_model=List[Warehouse], dependencies=[Depends(conditional("warehouses"))])
+@async_endpoint
+def get_warehouses(session: Session = Depends(get_session)):
+    return list_warehouses(session)
+
+def _apply_warehouse_fields(session: Session, warehouse: Warehouse, data: dict):
+    if "name" in data:
+        if not data["name"]:
+            raise HTTPException(status_code=400, detail="name is required")
+        existing = session.exec(select(Warehouse).where(Warehouse.name == data["name"])).first()
+        if existing and existing.id != warehouse.id:
+            raise HTTPException(status_code=400, detail="Warehouse already exists")
+    for field in ("name", "region", "status"):
+        if field in data:
+            setattr(warehouse, field, data[field])
+    warehouse.updated_at = datetime.utcnow()
+
+@app.post("/api/warehouses", response_model=Warehouse, dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+@async_endpoint
+def create_warehouse(data: dict, session: Session = Depends(get_session)):
+    if not data.get("name"):
+        raise HTTPException(status_code=400, detail="name is required")
+    warehouse = Warehouse(name=data["name"])
+    _apply_warehouse_fields(session, warehouse, data)
+    _save(session, warehouse)
+    invalidate_warehouses()
+    return warehouse
+
+# No DELETE: activities and balances keep pointing at a warehouse; set status instead
+@app.patch("/api/warehouses/{warehouse_id}", response_model=Warehouse, dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+@async_endpoint
+def update_warehouse(warehouse_id: int, data: dict, session: Session = Depends(get_session)):
+    warehouse = session.get(Warehouse, warehouse_id)
+    if not warehouse:
+        raise HTTPException(status_code=404, detail="Warehouse not found")
+    _apply_warehouse_fields(session, warehouse, data)
+    _save(session, warehouse)
+    invalidate_warehouses()
+    return warehouse
+
 # --- User Endpoints ---
-@app.get("/api/users", response_model=List[User])
-def get_users(session: Session = Depends(get_session)):
-    return session.exec(select(User)).all()
+@app.get("/api/users", response_model=List[UserRead], dependencies=[Depends(conditional("users"))])
+@async_endpoint
+def get_users(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=0, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None,
+    warehouse_id: Optional[int] = Depends(warehouse_scope),
+    session: Session = Depends(get_session),
+):
+    limit = page_limit(limit)
+    scope = in_warehouse(User.warehouse_id, warehouse_id)
+    if cursor is None and limit is None and fields is None:
+        users = reference_cache.get_or_load(
+            ("users", "all" if warehouse_id is None else warehouse_id, data_versions(request, "users")),
+            lambda: [
+                UserRead.model_validate(user, from_attributes=True).model_dump()
+                for user in session.exec(select(User).where(*scope).order_by(User.id))
+            ],
+        )
+        return row_response(users, response) if fast_json else users
+    return paginate(session, User, response, *scope, cursor=cursor, limit=limit, fields=fields, hidden=("password_hash",), schema=UserRead)
+
+def _save(session: Session, obj):
+    session.add(obj)
+    session.commit()
+    session.refresh(obj)
+    return obj
 
-@app.post("/api/users", response_model=User)
-def create_user(user_data: dict, session: Session = Depends(get_session)):
+async def _check_user_warehouse(session, warehouse_id):
+    # A 400 here rather than a foreign key error (500) on PostgreSQL
+    if warehouse_id is not None and not await run_db(session, known_warehouse, warehouse_id):
+        raise HTTPException(status_code=400, detail=f"Unknown warehouse {warehouse_id}")
+
+@app.post("/api/users", response_model=UserRead, dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+async def create_user(user_data: dict, session: Session = Depends(get_db_session)):
     # Check if user already exists
-    statement = select(User).where(User.username == user_data["username"])
-    if session.exec(statement).first():
+    if await run_db(session, find_user, user_data["username"]):
         raise HTTPException(status_code=400, detail="Username already exists")
+    await _check_user_warehouse(session, user_data.get("warehouse_id"))
     
     new_user = User(
         username=user_data["username"],
-        password_hash=get_password_hash(user_data.get("password", "change_me")),
+        password_hash=await get_password_hash_async(user_data.get("password", "change_me")),
         name=user_data.get("name"),
         role=user_data.get("role", "storekeeper"),
-        status=user_data.get("status", "Active")
+        status=user_data.get("status", "Active"),
+        warehouse_id=user_data.get("warehouse_id"),
     )
-    session.add(new_user)
-    session.commit()
-    session.refresh(new_user)
+    await run_db(session, _save, new_user)
+    invalidate_users()
     return new_user
 
-@app.patch("/api/users/{user_id}", response_model=User)
-def update_user(user_id: int, data: dict, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
+@app.patch("/api/users/{user_id}", response_model=UserRead, dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+async def update_user(user_id: int, data: dict, session: Session = Depends(get_db_session)):
+    user = await run_db(session, Session.get, User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -191,15 +646,20 @@ def update_user(user_id: int, data: dict, session: Session = Depends(get_session
         user.role = data["role"]
     if "status" in data:
         user.status = data["status"]
+    if "warehouse_id" in data:
+        await _check_user_warehouse(session, data["warehouse_id"])
+        user.warehouse_id = data["warehouse_id"]
     if "password" in data and data["password"]:
-        user.password_hash = get_password_hash(data["password"])
+        user.password_hash = await get_password_hash_async(data["password"])
     
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    await run_db(session, _save, user)
+    invalidate_users()
+    # Role, status, warehouse or password may have changed
+    revoke_tokens()
     return user
 
-@app.delete("/api/users/{user_id}")
+@app.delete("/api/users/{user_id}", dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+@async_endpoint
 def delete_user(user_id: int, session: Session = Depends(get_session)):
     user = session.get(User, user_id)
     if not user:
@@ -207,25 +667,130 @@ def delete_user(user_id: int, session: Session = Depends(get_session)):
     
     session.delete(user)
     session.commit()
+    invalidate_users()
+    revoke_tokens()
     return {"status": "success", "message": "User deleted successfully"}
 
-@app.post("/api/migrate-users")
-def migrate_users(users: List[dict], session: Session = Depends(get_session)):
+# --- Report Endpoints ---
+@app.get("/api/reports/{report_type}")
+def export_report(
+    request: Request,
+    report_type: str,
+    format: str = "csv",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    user: Optional[str] = None,
+    warehouse_id: Optional[int] = Depends(warehouse_scope),
+):
+    if report_type not in REPORT_TYPES:
+        raise HTTPException(status_code=404, detail="Unknown report type")
+    rows = report_rows(report_type, start, end, user, warehouse_id, bind=read_bind(request))
+    filename = f"{report_type}_report_{date.today().isoformat()}"
+
+    if format == "csv":
+        body, media_type = stream_csv(rows), "text/csv; charset=utf-8"
+    elif format == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=400, detail="XLSX export requires openpyxl")
+        body = stream_xlsx(rows, REPORT_TITLES[report_type])
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        raise HTTPException(status_code=400, detail="format must be csv or xlsx")
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+# --- Sync Endpoint ---
+SYNC_CHUNK_SIZE = 500
+
+def _public_rows(table_name, rows):
+    if table_name == "users":
+        return [UserRead.model_validate(row, from_attributes=True) for row in rows]
+    return rows
+
+def _in_scope(model, warehouse_id: Optional[int]):
+    # Regional staff sync only their warehouse's activities
+    return in_warehouse(Activity.warehouse_id, warehouse_id) if model is Activity else []
+
+@app.get("/api/sync")
+def sync(since: Optional[int] = None, warehouse_id: Optional[int] = Depends(warehouse_scope), session: Session = Depends(get_read_session)):
+    # Read the cursor first: anything written meanwhile is sent again next time
+    cursor = current_cursor(session)
+    delta = changes_since(session, since, cursor) if since and since <= cursor else None
+
+    result = {"cursor": str(cursor), "reset": delta is None}
+    if delta is None:
+        # First sync, a wiped database, or a reset in the window: full snapshot
+        for table_name, model in TRACKED_TABLES.items():
+            result[table_name] = _public_rows(table_name, session.exec(select(model).where(*_in_scope(model, warehouse_id)).order_by(model.id)).all())
+        result["deleted"] = {table_name: [] for table_name in TRACKED_TABLES}
+        return result
+
+    upserts, deletes = delta
+    for table_name, model in TRACKED_TABLES.items():
+        ids = sorted(upserts[table_name])
+        rows = []
+        for i in range(0, len(ids), SYNC_CHUNK_SIZE):
+            chunk = ids[i:i + SYNC_CHUNK_SIZE]
+            rows.extend(session.exec(select(model).where(model.id.in_(chunk), *_in_scope(model, warehouse_id)).order_by(model.id)).all())
+        result[table_name] = _public_rows(table_name, rows)
+    result["deleted"] = deletes
+    return result
+
+# --- Live Updates ---
+@app.get("/api/events")
+async def events(request: Request, last_event_id: Optional[int] = None, warehouse_id: Optional[int] = Depends(warehouse_scope)):
+    # Browsers send Last-Event-ID on reconnect; the query param covers first connects
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(
+        # Users attached to a warehouse only hear about its activities
+        event_stream(request, last_event_id, warehouse_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/migrate-users", dependencies=[Depends(require_roles(*ADMIN_ROLES))])
+async def migrate_users(users: List[dict], session: Session = Depends(get_db_session)):
+    # One lookup for the whole batch instead of a select per user
+    usernames = [u_data["username"] for u_data in users]
+    existing = set(await run_db(
+        session, lambda s: s.exec(select(User.username).where(User.username.in_(usernames))).all()
+    ))
+    to_create = []
     for u_data in users:
-        # Check if user already exists
-        statement = select(User).where(User.username == u_data["username"])
-        existing = session.exec(statement).first()
-        if not existing:
-            new_user = User(
-                username=u_data["username"],
-                password_hash=get_password_hash(u_data.get("password", "change_me")),
-                name=u_data.get("name", u_data["username"]),
-                role=u_data.get("role", "storekeeper"),
-                status=u_data.get("status", "Active")
-            )
-            session.add(new_user)
-    session.commit()
+        if u_data["username"] not in existing:
+            existing.add(u_data["username"])
+            to_create.append(u_data)
+
+    # Hash every new user in parallel across the pool's processes
+    hashes = await get_password_hashes_async([u_data.get("password", "change_me") for u_data in to_create])
+    for u_data, password_hash in zip(to_create, hashes):
+        session.add(User(
+            username=u_data["username"],
+            password_hash=password_hash,
+            name=u_data.get("name", u_data["username"]),
+            role=u_data.get("role", "storekeeper"),
+            status=u_data.get("status", "Active")
+        ))
+    await run_db(session, Session.commit)
+    invalidate_users()
     return {"status": "success", "message": "Users migrated successfully"}
 
+@app.get("/api/cache/stats")
+def cache_stats():
+    return reference_cache.stats()
+
+@app.get("/api/hashing/stats")
+def hash_pool_stats():
+    return hashing_stats()
+
+@app.get("/api/db/stats")
+def db_pool_stats():
+    return get_pool_stats()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
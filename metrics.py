@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+
+# Requests slower than this get a log line with their query breakdown
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+
+# SQL stats for the request being handled. The dict is shared, so queries
+# run in threadpool workers (which get a copy of the context) still count.
+_request_queries: ContextVar[Optional[dict]] = ContextVar("request_queries", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    """Per-process request and query metrics, rendered in Prometheus text format.
+
+    Each gunicorn worker keeps its own numbers, so a scrape reports the
+    worker that answered it; run one worker (or scrape each) for totals.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = defaultdict(int)  # (method, route, status) -> count
+        self.latency = {}  # (method, route) -> Histogram
+        self.queries = {}  # (method, route) -> Histogram of queries per request
+        self.query_seconds = defaultdict(float)  # (method, route) -> seconds
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, method: str, route: str, status: int, seconds: Optional[float], query_stats: dict):
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[(method, route, status)] += 1
+            if seconds is not None:
+                self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(query_stats["count"])
+            self.query_seconds[key] += query_stats["seconds"]
+
+    def render(self, extra: Optional[dict] = None) -> str:
+        """`extra` maps metric name -> (type, help, value) for process-wide figures."""
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP http_requests_in_flight Requests currently being handled.",
+                "# TYPE http_requests_in_flight gauge",
+                f"http_requests_in_flight {self.in_flight}",
+                "# HELP http_requests_total Requests by route and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+            lines += _histogram_lines(
+                "http_request_duration_seconds", "Request latency by route (streams excluded).", self.latency
+            )
+            lines += _histogram_lines("db_queries_per_request", "SQL statements executed per request.", self.queries)
+            lines += [
+                "# HELP db_query_seconds_total Time spent executing SQL statements by route (row fetching excluded).",
+                "# TYPE db_query_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self.query_seconds.items()):
+                lines.append(f"db_query_seconds_total{_labels(method=method, route=route)} {seconds:.6f}")
+        for name, (kind, help_text, value) in sorted((extra or {}).items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, help_text: str, histograms: dict):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(method=method, route=route, le='+Inf')} {histogram.total}")
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.total}")
+    return lines
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine):
+    """Count and time every statement run on `engine` against the current request.
+
+    The time covers executing the statement, not fetching its rows
+    afterwards, so a query that returns a large result set looks cheaper
+    than it is; the request latency includes both.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        stats = _request_queries.get()
+        if stats is None:
+            return
+        stats["count"] += 1
+        stats["seconds"] += seconds
+        # Statements are parameterised, so the text groups repeats (N+1s)
+        entry = stats["statements"].setdefault(" ".join(statement.split())[:200], [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL usage per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        query_stats = {"count": 0, "seconds": 0.0, "statements": {}}
+        token = _request_queries.set(query_stats)
+        response = {"status": 500, "streaming": False}
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name == b"content-type" and value.startswith(b"text/event-stream"):
+                        response["streaming"] = True
+            await send(message)
+
+        metrics.request_started()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            _request_queries.reset(token)
+            route = scope.get("route")
+            # Route templates, not raw paths, keep label cardinality bounded
+            route_path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            # Long-lived event streams would swamp the latency histogram
+            metrics.request_finished(method, route_path, response["status"], None if response["streaming"] else seconds, query_stats)
+            if not response["streaming"] and seconds * 1000 >= SLOW_REQUEST_MS:
+                _log_slow_request(method, scope["path"], route_path, response["status"], seconds, query_stats)
+
+
+def _log_slow_request(method, path, route, status, seconds, query_stats):
+    top = sorted(query_stats["statements"].items(), key=lambda item: item[1][1], reverse=True)[:5]
+    print(json.dumps({
+        "event": "slow_request",
+        "method": method,
+        "path": path,
+        "route": route,
+        "status": status,
+        "duration_ms": round(seconds * 1000, 1),
+        "queries": query_stats["count"],
+        "query_ms": round(query_stats["seconds"] * 1000, 1),  # execute only, see instrument_engine
+        "top_queries": [
+            {"sql": sql, "count": count, "ms": round(total * 1000, 1)} for sql, (count, total) in top
+        ],
+    }), flush=True)
@@ -0,0 +1,278 @@
+import os
+import sys
+from sqlalchemy import String, UniqueConstraint, and_, bindparam, case, cast, exists, inspect, or_, text, update
+from sqlalchemy.schema import AddConstraint
+from sqlmodel import Session, select
+
+# Ensure backend folder is in sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import engine, create_db_and_tables
+from models import User, Item, Activity, StockBalance, DailyMovement, InventorySnapshot, ChangeLog
+from inventory import ACTION_IN, ACTION_OUT, DIRECTION_IN, DIRECTION_OUT, item_index, parse_movement, parse_activity_date, rebuild_balances, rebuild_daily_movements
+from changes import TRACKED_TABLES, record_reset
+from search import ensure_search_index
+from archive import ensure_partitions, archives_between, missing_files
+from snapshots import rebuild_snapshots
+from warehouses import backfill_warehouses, default_warehouse_id
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def add_missing_columns(engine, model):
+    """ALTER TABLE in any model columns that an older database doesn't have yet.
+
+    create_all() only creates missing tables, so columns added to existing
+    models have to be patched in here.
+    """
+    table = model.__table__
+    existing = {col["name"] for col in inspect(engine).get_columns(table.name)}
+    missing = [col for col in table.columns if col.name not in existing]
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for col in missing:
+            col_type = col.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(col.name)} {col_type}"))
+    return [col.name for col in missing]
+
+
+def ensure_indexes(engine, model):
+    with engine.begin() as conn:
+        for index in model.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+
+def add_warehouse_key(engine, model, warehouse_id: int) -> bool:
+    """Key a rollup table from before warehouses by warehouse_id as well.
+
+    Existing rows all belong to `warehouse_id`. SQLite can't change a
+    table's constraints in place, so there the rows are copied into a
+    freshly created table.
+    """
+    table = model.__table__
+    existing = [col["name"] for col in inspect(engine).get_columns(table.name)]
+    if "warehouse_id" in existing:
+        return False
+    preparer = engine.dialect.identifier_preparer
+    name = preparer.quote(table.name)
+    columns = ", ".join(preparer.quote(column) for column in existing)
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            old = preparer.quote(f"{table.name}_old")
+            # Index names are global in SQLite; the new table recreates them
+            for index in inspect(conn).get_indexes(table.name):
+                conn.execute(text(f"DROP INDEX {preparer.quote(index['name'])}"))
+            conn.execute(text(f"ALTER TABLE {name} RENAME TO {old}"))
+            table.create(conn)
+            conn.execute(
+                text(f"INSERT INTO {name} ({columns}, warehouse_id) SELECT {columns}, :warehouse_id FROM {old}"),
+                {"warehouse_id": warehouse_id},
+            )
+            conn.execute(text(f"DROP TABLE {old}"))
+        else:
+            conn.execute(text(f"ALTER TABLE {name} ADD COLUMN warehouse_id INTEGER"))
+            conn.execute(text(f"UPDATE {name} SET warehouse_id = :warehouse_id"), {"warehouse_id": warehouse_id})
+            conn.execute(text(f"ALTER TABLE {name} ALTER COLUMN warehouse_id SET NOT NULL"))
+            for constraint in inspect(conn).get_unique_constraints(table.name):
+                conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {preparer.quote(constraint['name'])}"))
+            for constraint in table.constraints:
+                if isinstance(constraint, UniqueConstraint):
+                    conn.execute(AddConstraint(constraint))
+    return True
+
+
+def _activity_batches(session: Session, condition, batch_size: int):
+    """Yield id-ordered batches of activities matching `condition`, committing after each."""
+    last_id = 0
+    while True:
+        batch = session.exec(
+            select(Activity)
+            .where(Activity.id > last_id, condition)
+            .order_by(Activity.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+        yield batch
+        last_id = batch[-1].id
+        session.commit()
+
+
+def backfill_movements(engine, batch_size: int = BACKFILL_BATCH_SIZE):
+    """Fill direction/quantity/item_id/item_name from the legacy action string."""
+    updated = 0
+    with Session(engine) as session:
+        by_name, by_name_category = item_index(session)
+
+        for batch in _activity_batches(session, Activity.direction == None, batch_size):  # noqa: E711
+            for activity in batch:
+                movement = parse_movement(activity.action)
+                if movement:
+                    direction, qty, item_name = movement
+                    activity.direction = direction
+                    activity.quantity = qty
+                    activity.item_name = item_name
+                    activity.item_id = by_name_category.get((item_name, activity.item_category)) or by_name.get(item_name)
+                    session.add(activity)
+                    updated += 1
+    return updated
+
+
+def backfill_item_names(engine, batch_size: int = BACKFILL_BATCH_SIZE):
+    """Fill item_name on rows whose other movement columns predate it."""
+    updated = 0
+    statement = update(Activity).where(Activity.id == bindparam("row_id")).values(item_name=bindparam("name"))
+    with Session(engine) as session:
+        last_id = 0
+        while True:
+            batch = session.execute(
+                select(Activity.id, Activity.action)
+                .where(Activity.id > last_id, Activity.item_name == None, Activity.direction != None)  # noqa: E711
+                .order_by(Activity.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            names = [
+                {"row_id": row.id, "name": movement[2]} for row in batch for movement in [parse_movement(row.action)] if movement
+            ]
+            if names:
+                # Core executemany: one statement per batch, not one flush per row
+                session.connection().execute(statement, names)
+                updated += len(names)
+        if updated:
+            # Not journalled row by row; clients resync instead
+            record_reset(session, "activities")
+        session.commit()
+    return updated
+
+
+def rederive_movements(engine, batch_size: int = BACKFILL_BATCH_SIZE):
+    """Re-derive the movement columns of rows whose client-sent values disagree with the action text.
+
+    Balances and rollups were booked from those columns, so when any row
+    changes they are replayed from the text. Rows whose columns spell out
+    their action exactly are skipped in SQL, so this is cheap on every start.
+    """
+    updated = 0
+    expected = (
+        case((Activity.direction == DIRECTION_IN, ACTION_IN), else_=ACTION_OUT)
+        .concat(": ").concat(cast(Activity.quantity, String)).concat(" ").concat(Activity.item_name)
+    )
+    wrong_item = ~exists().where(Item.id == Activity.item_id, Item.name == Activity.item_name)
+    suspect = or_(
+        Activity.direction.not_in((DIRECTION_IN, DIRECTION_OUT)),
+        expected == None,  # noqa: E711
+        expected != Activity.action,
+        and_(Activity.item_id != None, wrong_item),  # noqa: E711
+    )
+    statement = (
+        update(Activity).where(Activity.id == bindparam("row_id"))
+        .values(direction=bindparam("dir"), quantity=bindparam("qty"), item_name=bindparam("name"), item_id=bindparam("item"))
+    )
+    with Session(engine) as session:
+        by_name, by_name_category = item_index(session)
+
+        last_id = 0
+        while True:
+            batch = session.execute(
+                select(Activity.id, Activity.action, Activity.direction, Activity.quantity, Activity.item_name, Activity.item_id, Activity.item_category)
+                .where(Activity.id > last_id, Activity.direction != None, suspect)  # noqa: E711
+                .order_by(Activity.id)
+                .limit(batch_size)
+            ).all()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            changes = []
+            for row in batch:
+                direction, qty, name = parse_movement(row.action) or (None, None, None)
+                item_id = by_name_category.get((name, row.item_category)) or by_name.get(name)
+                if (direction, qty, name, item_id) != (row.direction, row.quantity, row.item_name, row.item_id):
+                    changes.append({"row_id": row.id, "dir": direction, "qty": qty, "name": name, "item": item_id})
+            if changes:
+                session.connection().execute(statement, changes)
+                updated += len(changes)
+        if updated:
+            record_reset(session, "activities")
+        session.commit()
+        if updated:
+            rebuild_balances(session)
+            rebuild_daily_movements(session)
+    return updated
+
+
+def rekey_snapshots(engine):
+    """Rewrite checkpoints taken while uncatalogued items were summed as "Unknown"."""
+    with Session(engine) as session:
+        missing = missing_files(archives_between(session))
+        if missing:
+            print(f"Snapshots not rebuilt, archive files missing: {missing}. Run `python snapshots.py rebuild` once they are back.")
+            return
+        rebuild_snapshots(session)
+
+
+def backfill_activity_dates(engine, batch_size: int = BACKFILL_BATCH_SIZE):
+    """Fill activity_date from the legacy dd/mm/yyyy string."""
+    updated = 0
+    with Session(engine) as session:
+        for batch in _activity_batches(session, Activity.activity_date == None, batch_size):  # noqa: E711
+            for activity in batch:
+                parsed = parse_activity_date(activity.date)
+                if parsed:
+                    activity.activity_date = parsed
+                    session.add(activity)
+                    updated += 1
+    return updated
+
+
+def position_change_log(engine) -> bool:
+    """Add the transaction id that orders change_log entries on PostgreSQL.
+
+    Older entries have none, so cursors handed out before it are answered
+    with a reset and a full snapshot.
+    """
+    added = add_missing_columns(engine, ChangeLog)
+    ensure_indexes(engine, ChangeLog)
+    if not added or engine.dialect.name != "postgresql":
+        return False
+    with Session(engine) as session:
+        for table_name in TRACKED_TABLES:
+            record_reset(session, table_name)
+        session.commit()
+    return True
+
+
+def run_migrations(engine):
+    for model in (User, Item, Activity):
+        add_missing_columns(engine, model)
+    ensure_indexes(engine, Activity)
+    position_change_log(engine)
+    ensure_search_index(engine)
+    ensure_partitions(engine)
+    backfill_warehouses(engine)
+    for model in (StockBalance, DailyMovement, InventorySnapshot):
+        add_warehouse_key(engine, model, default_warehouse_id())
+    backfill_movements(engine)
+    renamed = backfill_item_names(engine)
+    backfill_activity_dates(engine)
+    rederived = rederive_movements(engine)
+    if renamed or rederived:
+        rekey_snapshots(engine)
+
+
+if __name__ == "__main__":
+    create_db_and_tables()
+    added = [col for model in (User, Item, Activity) for col in add_missing_columns(engine, model)]
+    ensure_indexes(engine, Activity)
+    print(f"Added columns: {added or 'none'}")
+    if position_change_log(engine):
+        print("Change log now ordered by transaction; sync clients will resync once.")
+    print(f"Booked {backfill_warehouses(engine)} activities into the default warehouse.")
+    rekeyed = [model.__tablename__ for model in (StockBalance, DailyMovement, InventorySnapshot) if add_warehouse_key(engine, model, default_warehouse_id())]
+    print(f"Keyed by warehouse: {rekeyed or 'none'}")
+    print(f"Backfilled movements on {backfill_movements(engine)} activities.")
+    print(f"Backfilled item names on {backfill_item_names(engine)} activities.")
+    print(f"Backfilled dates on {backfill_activity_dates(engine)} activities.")
+    print(f"Re-derived movements on {rederive_movements(engine)} activities.")
@@ -1,7 +1,16 @@
-from datetime import datetime
+from datetime import datetime, date
 from typing import Optional, List
+from sqlalchemy import BigInteger, Index, UniqueConstraint, text
 from sqlmodel import SQLModel, Field, Relationship
 
+class Warehouse(SQLModel, table=True):
+    # A regional store; the first one (lowest id) is the main office store
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+    region: Optional[str] = None
+    status: str = "Active"
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+
 class User(SQLModel, table=True):
     __tablename__ = "wh_users"
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -10,15 +19,44 @@ class User(SQLModel, table=True):
     name: str
     role: str  # 'wasiir', 'agaasime', 'storekeeper'
     status: str = "Active"
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    # Regional staff only see their own warehouse; None means every warehouse
+    warehouse_id: Optional[int] = Field(default=None, foreign_key="warehouse.id")
+
+class UserRead(SQLModel):
+    # Public view of a user; never exposes password_hash
+    id: Optional[int] = None
+    username: str
+    name: str
+    role: str
+    status: str = "Active"
+    warehouse_id: Optional[int] = None
 
 class Item(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True)
     category: str = Field(index=True)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
 
 class Activity(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_activity_status_date", "status", "activity_date"),
+        Index("ix_activity_user_date", "user", "activity_date"),
+        Index("ix_activity_item_category_date", "item_category", "activity_date"),
+        # Per-site queries touch only that warehouse's rows
+        Index("ix_activity_warehouse_item", "warehouse_id", "item_id"),
+        Index("ix_activity_warehouse_date", "warehouse_id", "activity_date"),
+        # Partial index: only the (small) approval queue is indexed
+        Index(
+            "ix_activity_pending",
+            "id",
+            postgresql_where=text("status = 'Pending'"),
+            sqlite_where=text("status = 'Pending'"),
+        ),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     date: str  # format dd/mm/yyyy
+    activity_date: Optional[date] = Field(default=None, index=True)  # parsed copy of `date`
     action: str
     item_category: Optional[str] = None
     recipient: str
@@ -26,3 +64,85 @@ class Activity(SQLModel, table=True):
     comment: Optional[str] = None
     status: str = "Approved" # Default for old, "Pending" for new storekeeper entries
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
+    # Structured copy of `action`, filled on create (and by migrations.py for old rows)
+    direction: Optional[str] = Field(default=None, index=True)  # 'in' / 'out'
+    quantity: Optional[int] = None
+    item_id: Optional[int] = Field(default=None, foreign_key="item.id", index=True)
+    # Name as written in `action`: what stock is keyed by, catalogued or not
+    item_name: Optional[str] = None
+    # Filled with the default warehouse when left out
+    warehouse_id: Optional[int] = Field(default=None, foreign_key="warehouse.id")
+    # Both legs of a transfer carry the id of the outbound one
+    transfer_id: Optional[int] = Field(default=None, index=True)
+
+class StockBalance(SQLModel, table=True):
+    # Materialized running total per warehouse and item, maintained alongside Activity writes
+    __tablename__ = "stock_balance"
+    __table_args__ = (UniqueConstraint("warehouse_id", "item_name", "category"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    warehouse_id: int
+    item_name: str = Field(index=True)
+    category: str
+    quantity: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class DailyMovement(SQLModel, table=True):
+    # Per-day totals of approved movements, maintained alongside StockBalance
+    __tablename__ = "daily_movement"
+    __table_args__ = (UniqueConstraint("warehouse_id", "movement_date", "item_name", "category", "direction"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    warehouse_id: int
+    movement_date: date = Field(index=True)
+    item_name: str
+    category: str
+    direction: str  # 'in', 'out'
+    quantity: int = 0
+
+class InventorySnapshot(SQLModel, table=True):
+    # Stock per warehouse and item at the end of snapshot_date (dated, approved movements)
+    __tablename__ = "inventory_snapshot"
+    __table_args__ = (UniqueConstraint("snapshot_date", "warehouse_id", "item_name", "category"),)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    snapshot_date: date = Field(index=True)
+    warehouse_id: int
+    item_name: str
+    category: str
+    quantity: int = 0
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ActivityArchive(SQLModel, table=True):
+    # One row per closed period moved out of the activity table by archive.py
+    __tablename__ = "activity_archive"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    period: str = Field(unique=True)  # '2024-05' (monthly) or '2024' (yearly)
+    period_start: date
+    period_end: date = Field(index=True)  # inclusive; a snapshot is kept for this day
+    filename: str  # gzipped JSONL under ARCHIVE_DIR
+    rows: int = 0
+    sha256: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ChangeLog(SQLModel, table=True):
+    # Append-only journal of writes, read by /api/sync and /api/events
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_table_id", "table_name", "id"),
+        Index("ix_change_log_txid", "txid", "id"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    table_name: str  # 'items', 'activities', 'users'
+    row_id: int
+    op: str  # 'upsert', 'delete', 'reset'
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+    # Writing transaction on PostgreSQL, where ids don't commit in order
+    txid: Optional[int] = Field(default=None, sa_type=BigInteger)
+
+class ImportBatch(SQLModel, table=True):
+    # Remembers the outcome of a bulk import so a retried batch_key is a no-op
+    __tablename__ = "import_batch"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    batch_key: str = Field(index=True, unique=True)
+    kind: str  # 'items', 'activities'
+    result: str  # JSON summary returned to the client
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,134 @@
+import os
+from typing import Optional, Sequence
+from fastapi import HTTPException, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlmodel import Session, select
+
+# Upper bound for ?limit=, and the page size when there is none; ?limit=0
+# asks for the whole list (the dashboard's first load)
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = min(int(os.getenv("DEFAULT_PAGE_SIZE", "500")), MAX_PAGE_SIZE)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Opt-in: encode list responses straight from database rows with orjson,
+# skipping the per-row pydantic validation behind response_model
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    if FAST_JSON:
+        print("FAST_JSON needs orjson; using the standard encoder")
+
+fast_json = FAST_JSON and orjson is not None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded by orjson.
+
+    For the str/int/date/datetime/None values in these tables the bytes
+    match FastAPI's own encoding: compact separators, UTF-8 unescaped,
+    ISO dates.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def row_response(rows, response: Response, headers: Optional[dict] = None):
+    """Send already-serializable rows without going through the response_model.
+
+    A returned Response doesn't pick up headers set on the injected one
+    (ETag, Cache-Control), so they are copied across.
+    """
+    headers = {**{k: v for k, v in response.headers.items() if k != "content-length"}, **(headers or {})}
+    if fast_json:
+        return FastJSONResponse(rows, headers=headers)
+    return JSONResponse(jsonable_encoder(rows), headers=headers)
+
+
+def parse_fields(model, fields: Optional[str], hidden: Sequence[str] = ()):
+    """Turn ?fields=a,b into a list of columns, always keeping the id for the cursor."""
+    if not fields:
+        return None
+    columns = model.__table__.columns
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in columns or name in hidden]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return [columns[name] for name in names]
+
+
+def page_limit(limit: Optional[int]) -> Optional[int]:
+    """Turn ?limit= into a page size, or None for the whole list."""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return limit or None
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None or cursor == "":
+        return None
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    session: Session,
+    model,
+    response: Response,
+    *criteria,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    hidden: Sequence[str] = (),
+    schema=None,
+):
+    """Keyset-paginate `model` by id.
+
+    Rows come back in id order (ids are assigned in insertion order, so this
+    is also created_at order). When a page is full, the id to resume from is
+    returned in the X-Next-Cursor header.
+
+    `schema` is the endpoint's response_model (default: `model`); with
+    FAST_JSON its fields are selected as plain rows instead of objects.
+    """
+    columns = parse_fields(model, fields, hidden)
+    after = parse_cursor(cursor)
+    if columns is None and fast_json:
+        columns = [model.__table__.columns[name] for name in (schema or model).model_fields]
+
+    statement = select(*columns) if columns else select(model)
+    statement = statement.where(*criteria)
+    if after is not None:
+        statement = statement.where(model.id > after)
+    statement = statement.order_by(model.id)
+    if limit is not None:
+        # One extra row tells us whether another page exists
+        statement = statement.limit(limit + 1)
+
+    if columns:
+        # Plain columns: Core execution skips the ORM's per-row loading
+        result = session.connection().execute(statement)
+        keys = list(result.keys())
+        rows = [dict(zip(keys, row)) for row in result.fetchall()]
+    else:
+        rows = session.exec(statement).all()
+
+    headers = {}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers[NEXT_CURSOR_HEADER] = str(last["id"] if columns else last.id)
+
+    if columns:
+        # Partial (or FAST_JSON) rows are already plain data; bypass the response_model
+        return row_response(rows, response, headers)
+    response.headers.update(headers)
+    return rows
@@ -0,0 +1,118 @@
+import csv
+import io
+import tempfile
+from datetime import date
+from typing import Iterator, Optional
+from sqlalchemy import func, or_
+from sqlmodel import Session, select
+
+from database import engine
+from models import User, Activity
+from inventory import movement_totals, in_warehouse, totals_by_item
+from snapshots import stock_at
+from archive import archives_between, archived_rows, add_archived_movements
+
+REPORT_TYPES = ("inventory", "movement", "users")
+ROW_BATCH_SIZE = 1000
+
+REPORT_TITLES = {
+    "inventory": "Inventory Summary Report",
+    "movement": "Warbixinta Dhaqdhaqaaqa Hantida",
+    "users": "User Management Report",
+}
+REPORT_HEADERS = {
+    "inventory": ["Item Name", "Category", "Quantity"],
+    "movement": ["Date", "Activity", "Recipient/Source", "User", "Status"],
+    "users": ["Name", "Role", "Status"],
+}
+
+
+def _activity_filters(start: Optional[date], end: Optional[date], user: Optional[str], warehouse_id: Optional[int]):
+    # Like the dashboard, rows without a parseable date are never filtered out
+    criteria = in_warehouse(Activity.warehouse_id, warehouse_id)
+    if start:
+        criteria.append(or_(Activity.activity_date == None, Activity.activity_date >= start))  # noqa: E711
+    if end:
+        criteria.append(or_(Activity.activity_date == None, Activity.activity_date <= end))  # noqa: E711
+    if user:
+        criteria.append(Activity.user == user)
+    return criteria
+
+
+def _inventory_rows(session: Session, start, end, user, warehouse_id):
+    if end and not start and not user:
+        # "Stock as of end": nearest snapshot plus the movements after it
+        yield from stock_at(session, end, warehouse_id)
+        return
+    rows = session.execute(movement_totals(*_activity_filters(start, end, user, warehouse_id)))
+    totals = {(warehouse, name, category): total or 0 for warehouse, name, category, total in rows}
+    add_archived_movements(session, totals, start, end, user, warehouse_id)
+    yield from totals_by_item(totals)
+
+
+def _movement_rows(session: Session, start, end, user, warehouse_id):
+    statement = (
+        select(Activity.date, Activity.action, Activity.recipient, Activity.user, func.coalesce(Activity.status, "Approved"))
+        .where(*_activity_filters(start, end, user, warehouse_id))
+        .order_by(Activity.activity_date, Activity.id)
+        .execution_options(yield_per=ROW_BATCH_SIZE)
+    )
+    # Archived periods come first: they end before any date left in the table
+    for row in archived_rows(archives_between(session, start, end), start, end, user, warehouse_id):
+        yield row["date"], row["action"], row["recipient"], row["user"], row["status"] or "Approved"
+    yield from session.execute(statement)
+
+
+def _user_rows(session: Session, start, end, user, warehouse_id):
+    yield from session.execute(
+        select(User.name, User.role, User.status).where(*in_warehouse(User.warehouse_id, warehouse_id)).order_by(User.id)
+    )
+
+
+_ROW_SOURCES = {"inventory": _inventory_rows, "movement": _movement_rows, "users": _user_rows}
+
+
+def report_rows(
+    report_type: str, start: Optional[date] = None, end: Optional[date] = None, user: Optional[str] = None,
+    warehouse_id: Optional[int] = None, bind=None,
+):
+    """Yield the header row and then data rows, holding one DB batch at a time.
+
+    Opens its own session (on `bind`, the primary by default) because the
+    response body is produced after the request handler (and its session
+    dependency) has returned.
+    """
+    yield REPORT_HEADERS[report_type]
+    with Session(bind or engine) as session:
+        for row in _ROW_SOURCES[report_type](session, start, end, user, warehouse_id):
+            yield list(row)
+
+
+def stream_csv(rows) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the Somali text as UTF-8
+    yield "\ufeff".encode("utf-8")
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % ROW_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def stream_xlsx(rows, title: str) -> Iterator[bytes]:
+    # openpyxl is only needed for XLSX; CSV works without it
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=title[:31])
+    for row in rows:
+        sheet.append(row)
+    # A zip can't be emitted incrementally, so spool it (to disk past 8 MB)
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        workbook.save(spool)
+        spool.seek(0)
+        while chunk := spool.read(64 * 1024):
+            yield chunk
@@ -8,8 +8,13 @@ document.addEventListener('DOMContentLoaded', () => {
     const isLocalFile = window.location.protocol === 'file:';
     const API_BASE_URL = isLocalFile ? 'http://localhost:8000/api' : '/api';
     const getToken = () => sessionStorage.getItem('wh_token');
+    // Largest page the API serves (MAX_PAGE_SIZE)
+    const PAGE_SIZE = 1000;
+    // The dashboard lists only this many days of activity; totals come from the server
+    const RECENT_DAYS = 30;
 
-    async function apiFetch(endpoint, options = {}) {
+    // Returns { data, nextCursor } or null; nextCursor is the X-Next-Cursor header
+    async function apiFetchPage(endpoint, options = {}) {
         const headers = {
             'Content-Type': 'application/json',
             'Authorization': `Bearer ${getToken()}`,
@@ -31,7 +36,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 return null;
             }
 
-            return await response.json();
+            return { data: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
         } catch (err) {
             console.error('Fetch Error:', err);
             if (window.showToast) window.showToast(`Xiriirkii ayaa go'ay: ${err.message}`, 'error');
@@ -39,10 +44,58 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function apiFetch(endpoint, options = {}) {
+        const page = await apiFetchPage(endpoint, options);
+        return page ? page.data : null;
+    }
+
+    // Follows X-Next-Cursor page by page until the list is complete
+    async function apiFetchAll(endpoint) {
+        const separator = endpoint.includes('?') ? '&' : '?';
+        const rows = [];
+        let cursor = null;
+        do {
+            const query = `limit=${PAGE_SIZE}` + (cursor ? `&cursor=${encodeURIComponent(cursor)}` : '');
+            const page = await apiFetchPage(`${endpoint}${separator}${query}`);
+            if (!page) return null;
+            rows.push(...page.data);
+            cursor = page.nextCursor;
+        } while (cursor);
+        return rows;
+    }
+
+    // yyyy-mm-dd in local time, as the API's date filters expect
+    const toIsoDate = (d) => `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+
     // Initialize state
     let masterItems = [];
     let activities = [];
     let masterUsers = [];
+    let stockRows = [];
+    let dashboardStats = null;
+
+    // Recent activity plus the whole pending queue, not the full history
+    async function loadActivities() {
+        const since = new Date();
+        since.setDate(since.getDate() - RECENT_DAYS);
+        const [recent, pending] = await Promise.all([
+            apiFetchAll(`/activities?start=${toIsoDate(since)}`),
+            apiFetchAll('/approvals')
+        ]);
+        const byId = new Map();
+        [...(recent || []), ...(pending || [])].forEach(act => byId.set(act.id, act));
+        activities = [...byId.values()].sort((a, b) => a.id - b.id);
+    }
+
+    // Stock per warehouse and today's in/out, kept up to date by the server
+    async function loadTotals() {
+        const [rows, stats] = await Promise.all([
+            apiFetch('/inventory'),
+            apiFetch('/stats?days=1')
+        ]);
+        stockRows = rows || [];
+        dashboardStats = stats;
+    }
 
     async function loadInitialData() {
         try {
@@ -59,14 +112,14 @@ document.addEventListener('DOMContentLoaded', () => {
                 localStorage.removeItem('wh_master_users');
             }
 
-            const [items, acts, users] = await Promise.all([
-                apiFetch('/items'),
-                apiFetch('/activities'),
-                apiFetch('/users')
+            const [items, users] = await Promise.all([
+                apiFetchAll('/items'),
+                apiFetchAll('/users'),
+                loadActivities(),
+                loadTotals()
             ]);
 
             masterItems = items || [];
-            activities = acts || [];
             masterUsers = users || [];
 
             renderData();
@@ -252,24 +305,10 @@ document.addEventListener('DOMContentLoaded', () => {
             inventory[key] = 0;
         });
 
-        // ONLY process 'Approved' or transactions without a status (Legacy data)
-        activities.filter(a => !a.status || a.status === 'Approved').forEach(act => {
-            const parts = act.action.split(': ');
-            if (parts.length < 2) return;
-            const type = parts[0];
-            const detail = parts[1].split(' ');
-            const qtyStr = detail[0];
-            const qty = parseInt(qtyStr);
-            const itemName = detail.slice(1).join(' ');
-
-            // Try to find the category from activity metadata first, otherwise fallback to master list
-            const category = act.itemCategory || (masterItems.find(m => m.name === itemName)?.category) || 'General';
-            const key = `${itemName}|${category}`;
-
-            if (!isNaN(qty)) {
-                if (type === 'Geliyay') inventory[key] = (inventory[key] || 0) + qty;
-                else inventory[key] = (inventory[key] || 0) - qty;
-            }
+        // One balance row per warehouse and item; add them up per item
+        stockRows.forEach(row => {
+            const key = `${row.item_name}|${row.category}`;
+            inventory[key] = (inventory[key] || 0) + row.quantity;
         });
         return inventory;
     }
@@ -277,11 +316,10 @@ document.addEventListener('DOMContentLoaded', () => {
 
     function renderData() {
         const inventory = calculateInventory();
-        const today = new Date().toLocaleDateString('en-GB');
 
         let totalItems = 0;
-        let inToday = 0;
-        let outToday = 0;
+        const inToday = dashboardStats ? dashboardStats.in_today : 0;
+        const outToday = dashboardStats ? dashboardStats.out_today : 0;
         let lowStockCount = 0;
 
         Object.values(inventory).forEach(q => {
@@ -293,19 +331,6 @@ document.addEventListener('DOMContentLoaded', () => {
         // If masterItems is empty, everything should be 0.
         if (masterItems.length === 0) lowStockCount = 0;
 
-        activities.forEach(act => {
-            if (act.date === today) {
-                const parts = act.action.split(': ');
-                if (parts.length < 2) return;
-                const qtyStr = parts[1].split(' ')[0];
-                const qty = parseInt(qtyStr);
-                if (!isNaN(qty)) {
-                    if (act.action.includes('Geliyay')) inToday += qty;
-                    else outToday += qty;
-                }
-            }
-        });
-
         const statTotal = document.getElementById('stat-total');
         const statIn = document.getElementById('stat-in-today');
         const statOut = document.getElementById('stat-out-today');
@@ -517,6 +542,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 
                 if (response && response.status === 'success') {
                     activities = activities.filter(a => a.id !== id);
+                    await loadTotals();
                     renderData();
                     updateVerificationBadge();
                     if (window.showToast) window.showToast('Xogtii dib waa loo tirtiray (Deleted successfully)!', 'success');
@@ -538,6 +564,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (updated) {
                 const index = activities.findIndex(a => a.id === id);
                 if (index !== -1) activities[index].status = 'Approved';
+                await loadTotals();
                 renderData();
                 updateVerificationBadge();
                 showToast('Agabka waa la fasaxay (Approved)!', 'success');
@@ -618,6 +645,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             if (act) {
                 activities.push(act);
+                await loadTotals();
                 renderData();
                 showToast('Waa la xareeyay!', 'success');
             }
@@ -1100,7 +1128,7 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 
     // --- Export & Preview Logic ---
-    window.getFilteredReportData = () => {
+    window.getFilteredReportData = async () => {
         const type = document.getElementById('report-type').value;
         const startDateStr = document.getElementById('report-start-date').value;
         const endDateStr = document.getElementById('report-end-date').value;
@@ -1134,8 +1162,19 @@ document.addEventListener('DOMContentLoaded', () => {
             dateRangeTitle = `Ku eg: ${endDate.toLocaleDateString('Somali')}`;
         }
 
+        // Reports fetch their own range; `activities` only holds the recent window
+        let reportActivities = [];
+        if (type === 'inventory' || type === 'movement') {
+            const params = new URLSearchParams();
+            if (startDateStr) params.set('start', startDateStr);
+            if (endDateStr) params.set('end', endDateStr);
+            if (userFilter !== 'ALL') params.set('user', userFilter);
+            const query = params.toString();
+            reportActivities = await apiFetchAll(query ? `/activities?${query}` : '/activities') || [];
+        }
+
         if (type === 'inventory') {
-            const tempActivities = activities.filter(act => {
+            const tempActivities = reportActivities.filter(act => {
                 const actDate = parseDateString(act.date);
                 if (userFilter !== 'ALL' && act.user !== userFilter) return false;
                 if (!actDate) return true;
@@ -1176,7 +1215,7 @@ document.addEventListener('DOMContentLoaded', () => {
         } else if (type === 'movement') {
             title = "Warbixinta Dhaqdhaqaaqa Hantida";
             headers = ["Date", "Activity", "Recipient/Source", "User", "Status"];
-            data = activities.filter(act => {
+            data = reportActivities.filter(act => {
                 const actDate = parseDateString(act.date);
                 if (userFilter !== 'ALL' && act.user !== userFilter) return false;
                 if (!actDate) return true;
@@ -1194,8 +1233,8 @@ document.addEventListener('DOMContentLoaded', () => {
         return { title, headers, data, dateRangeTitle };
     };
 
-    window.handlePreview = () => {
-        const { title, headers, data, dateRangeTitle } = getFilteredReportData();
+    window.handlePreview = async () => {
+        const { title, headers, data, dateRangeTitle } = await getFilteredReportData();
         const previewCard = document.getElementById('preview-card');
         const previewContainer = document.getElementById('report-preview-container');
 
@@ -1223,9 +1262,9 @@ document.addEventListener('DOMContentLoaded', () => {
         previewCard.scrollIntoView({ behavior: 'smooth' });
     };
 
-    window.handleExport = () => {
+    window.handleExport = async () => {
         const format = document.getElementById('report-format').value;
-        const { title, headers, data, dateRangeTitle } = getFilteredReportData();
+        const { title, headers, data, dateRangeTitle } = await getFilteredReportData();
 
         if (data.length === 0) {
             showToast("Ma jirto xog la soo saaro!", "error");
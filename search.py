@@ -0,0 +1,205 @@
+import re
+from sqlalchemy import bindparam, text
+from sqlmodel import Session, select
+
+from models import Item
+
+MAX_SEARCH_LIMIT = 50
+# Candidates fetched from the index before ranking in Python
+CANDIDATE_LIMIT = 100
+# Fuzzy lookups OR together the query's rarest trigrams up to this many rows
+FUZZY_ROW_BUDGET = 2000
+# Same default as pg_trgm's similarity_threshold; "abacas" vs "abacus" is 0.4
+SIMILARITY_THRESHOLD = 0.3
+
+_WORD = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def trigrams(value: str) -> set:
+    """Trigrams the way pg_trgm builds them: per word, padded "  w" ... "d "."""
+    grams = set()
+    for word in _WORD.findall((value or "").lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _similarity(grams_a: set, grams_b: set) -> float:
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def similarity(a: str, b: str) -> float:
+    """pg_trgm's similarity(): shared trigrams over all trigrams."""
+    return _similarity(trigrams(a), trigrams(b))
+
+
+def ensure_search_index(engine) -> str:
+    """Create the trigram index for item names; returns the backend in use."""
+    if engine.dialect.name == "sqlite":
+        try:
+            with engine.begin() as conn:
+                exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'item_search'")).first()
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS item_search "
+                    "USING fts5(name, content='item', content_rowid='id', tokenize='trigram')"
+                ))
+                # External-content FTS table: triggers keep it in step with item
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS item_search_insert AFTER INSERT ON item BEGIN "
+                    "INSERT INTO item_search(rowid, name) VALUES (new.id, new.name); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS item_search_delete AFTER DELETE ON item BEGIN "
+                    "INSERT INTO item_search(item_search, rowid, name) VALUES ('delete', old.id, old.name); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS item_search_update AFTER UPDATE OF name ON item BEGIN "
+                    "INSERT INTO item_search(item_search, rowid, name) VALUES ('delete', old.id, old.name); "
+                    "INSERT INTO item_search(rowid, name) VALUES (new.id, new.name); END"
+                ))
+                # Per-trigram document counts, used to pick selective trigrams
+                conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS item_search_vocab USING fts5vocab(item_search, 'row')"))
+                if not exists:
+                    conn.execute(text("INSERT INTO item_search(item_search) VALUES ('rebuild')"))
+        except Exception as e:
+            # SQLite older than 3.34 has no trigram tokenizer
+            print(f"Item search index unavailable, using LIKE: {e}")
+            return "like"
+        return "fts5"
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_item_name_trgm ON item USING gin (lower(name) gin_trgm_ops)"
+                ))
+        except Exception as e:
+            # Managed databases may not allow CREATE EXTENSION
+            print(f"Item search index unavailable, using LIKE: {e}")
+            return "like"
+        return "trgm"
+    return "like"
+
+
+_backend = None
+
+
+def _detect_backend(session: Session) -> str:
+    global _backend
+    if _backend is None:
+        dialect = session.get_bind().dialect.name
+        if dialect == "sqlite":
+            found = session.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'item_search'")).first()
+            _backend = "fts5" if found else "like"
+        elif dialect == "postgresql":
+            found = session.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+            _backend = "trgm" if found else "like"
+        else:
+            _backend = "like"
+    return _backend
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_rows(session: Session, match: str, limit: int):
+    # Unranked: bm25 over every matching row costs far more than scoring
+    # a bounded candidate list in Python
+    return session.execute(
+        text(
+            "SELECT item.id, item.name, item.category FROM item_search "
+            "JOIN item ON item.id = item_search.rowid WHERE item_search MATCH :match LIMIT :limit"
+        ),
+        {"match": match, "limit": limit},
+    ).all()
+
+
+def _quote(gram: str) -> str:
+    return '"' + gram.replace('"', '""') + '"'
+
+
+def _candidates(session: Session, query: str, limit: int):
+    """(id, name, category) rows worth ranking for `query`."""
+    backend = _detect_backend(session)
+    lowered = query.lower()
+    pattern = f"%{_escape_like(lowered)}%"
+    if backend == "fts5" and len(lowered) >= 3:
+        # Substring hits first; a trigram phrase query is an index lookup
+        rows = _fts_rows(session, _quote(lowered), CANDIDATE_LIMIT)
+        if len(rows) >= limit:
+            return rows
+        # Misspellings: items sharing the query's rarest trigrams
+        grams = {lowered[i:i + 3] for i in range(len(lowered) - 2)}
+        counts = session.execute(
+            text("SELECT term, doc FROM item_search_vocab WHERE term IN :grams").bindparams(bindparam("grams", expanding=True)),
+            {"grams": sorted(grams)},
+        ).all()
+        terms = [term for term, doc in sorted(counts, key=lambda row: row[1])]
+        chosen, budget = [], 0
+        for term, doc in sorted(counts, key=lambda row: row[1]):
+            if len(chosen) >= 2 and budget + doc > FUZZY_ROW_BUDGET:
+                break
+            chosen.append(term)
+            budget += doc
+        # Widen to every trigram only when the selective ones find too little
+        return _merge(rows, limit, *(
+            (lambda grams=grams: _fts_rows(session, " OR ".join(map(_quote, grams)), CANDIDATE_LIMIT))
+            for grams in (chosen, terms) if grams
+        ))
+    if backend == "trgm":
+        return session.execute(
+            text(
+                "SELECT id, name, category FROM item WHERE lower(name) % :q OR lower(name) LIKE :pattern ESCAPE '\\' "
+                "ORDER BY similarity(lower(name), :q) DESC LIMIT :limit"
+            ),
+            {"q": lowered, "pattern": pattern, "limit": CANDIDATE_LIMIT},
+        ).all()
+    # Short queries (no full trigram) and databases without an index.
+    # No ORDER BY, so each scan stops as soon as it has enough rows.
+    statement = select(Item.id, Item.name, Item.category).limit(CANDIDATE_LIMIT)
+    prefix = f"{_escape_like(lowered)}%"
+    return _merge([], limit, *(
+        (lambda like=like: session.execute(statement.where(Item.name.ilike(like, escape="\\"))).all())
+        for like in (prefix, pattern)
+    ))
+
+
+def _merge(rows, limit: int, *lookups):
+    """Append rows from each lookup in turn until there are `limit` of them."""
+    seen = {row[0] for row in rows}
+    for lookup in lookups:
+        if len(rows) >= limit:
+            break
+        for row in lookup():
+            if row[0] not in seen:
+                seen.add(row[0])
+                rows.append(row)
+    return rows
+
+
+def search_items(session: Session, query: str, limit: int = 10):
+    """Items matching `query` by prefix, substring or spelling, best first."""
+    query = (query or "").strip()
+    if not query:
+        return []
+    lowered = query.lower()
+    query_grams = trigrams(query)
+    results = []
+    for item_id, item_name, category in _candidates(session, query, limit):
+        name = (item_name or "").lower()
+        score = _similarity(query_grams, trigrams(item_name))
+        # Typeahead: what the user has typed so far should win
+        if name.startswith(lowered):
+            score += 1.0
+        elif any(word.startswith(lowered) for word in name.split()):
+            score += 0.75
+        elif lowered in name:
+            score += 0.5
+        elif score < SIMILARITY_THRESHOLD:
+            continue
+        results.append({"id": item_id, "name": item_name, "category": category, "score": round(score, 3)})
+    results.sort(key=lambda result: (-result["score"], result["name"]))
+    return results[:limit]
@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import os
+import time
+from fastapi import HTTPException, Request
+from jose import JWTError
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from auth import decode_access_token, password_fingerprint
+from cache import TTLCache
+from database import engine
+from models import User
+
+# Verified tokens are trusted for this long before the user is re-read.
+# Edits in this worker revoke at once; the TTL bounds the other workers.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))
+
+ADMIN_ROLES = ("wasiir",)
+APPROVER_ROLES = ("wasiir", "agaasime")
+# /api paths served without a token
+PUBLIC_PATHS = ("/api/login",)
+# Bearer token for Prometheus scrapers on /metrics; admins' logins work too
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+
+def _unauthorized(detail: str):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def _bearer_token(request: Request):
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    # EventSource and download links can't set headers
+    return request.query_params.get("access_token")
+
+
+def _load_user(token: str) -> dict:
+    try:
+        claims = decode_access_token(token)
+    except JWTError:
+        raise _unauthorized("Invalid or expired token")
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == claims.get("sub"))).first()
+    if not user or user.status != "Active":
+        raise _unauthorized("Account not found or disabled")
+    if claims.get("pwd") != password_fingerprint(user.password_hash):
+        raise _unauthorized("Password changed; please log in again")
+    # Role and name come from the database, not the token, so edits apply
+    return {
+        "id": user.id, "username": user.username, "name": user.name, "role": user.role,
+        "warehouse_id": user.warehouse_id, "exp": claims["exp"],
+    }
+
+
+async def authenticate(request: Request):
+    """App-wide dependency: every /api route except login needs a valid token.
+
+    A cache hit costs one sha256 of the token and a dict lookup; the
+    signature check and user query only run on a miss.
+    """
+    path = request.url.path
+    if not path.startswith("/api/") or path in PUBLIC_PATHS:
+        return None
+    return await _token_user(request)
+
+
+async def _token_user(request: Request) -> dict:
+    token = _bearer_token(request)
+    if not token:
+        raise _unauthorized("Not authenticated")
+    key = ("token", hashlib.sha256(token.encode()).hexdigest())
+    user = token_cache.get(key)
+    if user is None or user["exp"] <= time.time():
+        user = await run_in_threadpool(_load_user, token)
+        token_cache.set(key, user)
+    request.state.user = user
+    return user
+
+
+def require_roles(*roles: str):
+    """Route dependency that answers 403 unless the caller has one of `roles`."""
+
+    async def dependency(request: Request):
+        if request.state.user["role"] not in roles:
+            raise HTTPException(status_code=403, detail="Not allowed for your role")
+
+    return dependency
+
+
+async def require_metrics_access(request: Request):
+    """Route dependency for /metrics, which is outside /api and so not covered by `authenticate`."""
+    token = _bearer_token(request)
+    if METRICS_TOKEN and token and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return
+    user = await _token_user(request)
+    if user["role"] not in ADMIN_ROLES:
+        raise HTTPException(status_code=403, detail="Not allowed for your role")
+
+
+def current_user(request: Request) -> dict:
+    return request.state.user
+
+
+def revoke_tokens():
+    # After a user edit or delete: every token is verified again on next use
+    token_cache.invalidate("token")
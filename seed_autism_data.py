@@ -9,6 +9,7 @@ sys.path.append(current_dir)
 
 from database import engine
 from models import Item, Activity
+from bulk import run_import
 
 items_to_add = [
     # Educational Materials
@@ -71,30 +72,32 @@ def seed_autism_data():
                 session.add(act)
         session.commit()
 
-        for item_data in items_to_add:
-            # Check if item exists to avoid duplication
-            existing_item = session.exec(select(Item).where(Item.name == item_data["name"])).first()
-            if not existing_item:
-                item = Item(name=item_data["name"], category=item_data["category"])
-                session.add(item)
-                session.commit()
-                session.refresh(item)
-            
-            # Add Inbound Activity only if it wasn't added before
-            existing_act = session.exec(select(Activity).where(Activity.comment == "Autism School Equipment Data Entry").where(Activity.action == f"Geliyay: {item_data['qty']} {item_data['name']}")).first()
-            if not existing_act:
-                activity = Activity(
-                    date=today,
-                    action=f"Geliyay: {item_data['qty']} {item_data['name']}",
-                    item_category=item_data["category"],
-                    recipient="mohamed whole sale",
-                    user="Salah Abdi Ismail",
-                    comment="Autism School Equipment Data Entry",
-                    status="Pending"
-                )
-                session.add(activity)
-            
-        session.commit()
+        # Check which items and activities exist already to avoid duplication
+        names = [item_data["name"] for item_data in items_to_add]
+        existing_items = set(session.exec(select(Item.name).where(Item.name.in_(names))).all())
+        existing_actions = {act.action for act in existing_acts}
+
+        new_items = [
+            {"name": item_data["name"], "category": item_data["category"]}
+            for item_data in items_to_add
+            if item_data["name"] not in existing_items
+        ]
+        new_activities = [
+            {
+                "date": today,
+                "action": f"Geliyay: {item_data['qty']} {item_data['name']}",
+                "item_category": item_data["category"],
+                "recipient": "mohamed whole sale",
+                "user": "Salah Abdi Ismail",
+                "comment": "Autism School Equipment Data Entry",
+                "status": "Pending",
+            }
+            for item_data in items_to_add
+            if f"Geliyay: {item_data['qty']} {item_data['name']}" not in existing_actions
+        ]
+        # Same batched path as POST /api/items/bulk and /api/activities/bulk
+        run_import(session, "items", new_items)
+        run_import(session, "activities", new_activities)
     print(f"Successfully added {len(items_to_add)} Autism equipment items.")
 
 if __name__ == "__main__":
@@ -8,7 +8,9 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
 from database import engine
-from models import Item, Activity
+from models import Item, Activity, StockBalance, DailyMovement, InventorySnapshot
+from bulk import run_import
+from changes import record_reset
 
 items_to_add = [
     # Electronics
@@ -71,31 +73,35 @@ def seed():
         # Clear existing data
         print("Clearing existing Items and Activities...")
         session.exec(select(Item)).all() # Ensure metadata is loaded if needed
-        session.exec(Item.__table__.delete())
+        session.exec(StockBalance.__table__.delete())
+        session.exec(DailyMovement.__table__.delete())
+        session.exec(InventorySnapshot.__table__.delete())
         session.exec(Activity.__table__.delete())
+        session.exec(Item.__table__.delete())
+        for table_name in ("items", "activities"):
+            record_reset(session, table_name)
         session.commit()
         
         print("Seeding new data...")
-        for item_data in items_to_add:
-            # Create item
-            item = Item(name=item_data["name"], category=item_data["category"])
-            session.add(item)
-            session.commit()
-            session.refresh(item)
-            
-            # Add Inbound Activity
-            activity = Activity(
-                date=today,
-                action=f"Geliyay: {item_data['qty']} {item_data['name']}",
-                item_category=item_data["category"],
-                recipient="Xafiiska Waxbarashada",
-                user="System Admin",
-                comment="Bulk Data Entry (Special Needs & Gender)",
-                status="Approved"
-            )
-            session.add(activity)
-            
-        session.commit()
+        # Same batched path as POST /api/items/bulk and /api/activities/bulk
+        run_import(session, "items", [
+            {"name": item_data["name"], "category": item_data["category"]}
+            for item_data in items_to_add
+        ])
+        result = run_import(session, "activities", [
+            {
+                "date": today,
+                "action": f"Geliyay: {item_data['qty']} {item_data['name']}",
+                "item_category": item_data["category"],
+                "recipient": "Xafiiska Waxbarashada",
+                "user": "System Admin",
+                "comment": "Bulk Data Entry (Special Needs & Gender)",
+                "status": "Approved",
+            }
+            for item_data in items_to_add
+        ])
+        for error in result["errors"]:
+            print(f"Skipped row {error['index']}: {error['error']}")
     print(f"Successfully reset database and added {len(items_to_add)} items.")
 
 if __name__ == "__main__":
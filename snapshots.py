@@ -0,0 +1,218 @@
+import asyncio
+import os
+import sys
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import delete, func, text
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from database import engine, create_db_and_tables
+from models import Activity, InventorySnapshot
+from inventory import movement_totals, archive_cutoff, archived_balances, in_warehouse, totals_by_item
+from archive import add_archived_movements, archives_between, missing_files
+
+# "monthly" checkpoints the last day of each month, "daily" every day,
+# "off" disables the background job (point-in-time queries still work)
+SNAPSHOT_INTERVAL = os.getenv("SNAPSHOT_INTERVAL", "monthly")
+SNAPSHOT_CHECK_SECONDS = float(os.getenv("SNAPSHOT_CHECK_SECONDS", "3600"))
+
+
+def _period_ends(first: date, last: date):
+    """Checkpoint dates in [first, last] for the configured interval."""
+    day = first
+    while day <= last:
+        if SNAPSHOT_INTERVAL == "daily" or (day + timedelta(days=1)).day == 1:
+            yield day
+        day += timedelta(days=1)
+
+
+Totals = Dict[Tuple[int, str, str], int]
+
+
+def _snapshot_rows(session: Session, snapshot_date: date, warehouse_id: Optional[int] = None) -> Totals:
+    rows = session.exec(
+        select(InventorySnapshot.warehouse_id, InventorySnapshot.item_name, InventorySnapshot.category, InventorySnapshot.quantity)
+        .where(InventorySnapshot.snapshot_date == snapshot_date, *in_warehouse(InventorySnapshot.warehouse_id, warehouse_id))
+    )
+    return {(warehouse, name, category): quantity for warehouse, name, category, quantity in rows}
+
+
+def _add_movements(totals: Totals, session: Session, *criteria):
+    for warehouse, name, category, total in session.execute(movement_totals(*criteria)):
+        key = (warehouse, name, category)
+        totals[key] = totals.get(key, 0) + (total or 0)
+    return totals
+
+
+def _nonzero(totals: Totals) -> Totals:
+    return {key: quantity for key, quantity in totals.items() if quantity}
+
+
+def latest_snapshot_date(session: Session, on_or_before: Optional[date] = None) -> Optional[date]:
+    statement = select(func.max(InventorySnapshot.snapshot_date))
+    if on_or_before is not None:
+        statement = statement.where(InventorySnapshot.snapshot_date <= on_or_before)
+    return session.exec(statement).one()
+
+
+def _dated_totals(session: Session, as_of: date, warehouse_id: Optional[int] = None) -> Totals:
+    """Totals of dated movements up to `as_of`, starting from the nearest snapshot."""
+    scope = in_warehouse(Activity.warehouse_id, warehouse_id)
+    base_date = latest_snapshot_date(session, as_of)
+    if base_date is None:
+        totals = _add_movements({}, session, Activity.activity_date <= as_of, *scope)
+    else:
+        totals = _add_movements(
+            _snapshot_rows(session, base_date, warehouse_id), session,
+            Activity.activity_date > base_date, Activity.activity_date <= as_of, *scope,
+        )
+    cutoff = archive_cutoff(session)
+    if cutoff and (base_date is None or base_date < min(as_of, cutoff)):
+        # Part of the range was archived: read those movements back from the files
+        start = base_date + timedelta(days=1) if base_date else None
+        add_archived_movements(session, totals, start, min(as_of, cutoff), warehouse_id=warehouse_id)
+    return totals
+
+
+def stock_at(session: Session, as_of: date, warehouse_id: Optional[int] = None):
+    """Rows of (item name, category, quantity) as of the end of `as_of`.
+
+    Costs one snapshot read plus the movements since it, rather than a
+    replay of the whole ledger. Undated legacy rows always count, as in
+    the unfiltered report. Without a warehouse, quantities are national.
+    """
+    totals = _dated_totals(session, as_of, warehouse_id)
+    _add_movements(totals, session, Activity.activity_date == None, *in_warehouse(Activity.warehouse_id, warehouse_id))  # noqa: E711
+    return totals_by_item(totals)
+
+
+def _hold_off_writers(session: Session, snapshot_date: date):
+    """Begin the checkpoint's write before its totals are read.
+
+    A back-dated write deletes the checkpoints it makes stale
+    (inventory.invalidate_snapshots). Were the totals read first, such a
+    write could commit in between, find nothing to delete, and leave the
+    checkpoint written here stale for good.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        # Conflicts with the ROW EXCLUSIVE lock taken by that DELETE: a writer
+        # already past it is waited for, a later one waits for this commit
+        session.execute(text("LOCK TABLE inventory_snapshot IN SHARE ROW EXCLUSIVE MODE"))
+    # On SQLite this first write takes the database write lock. It also
+    # replaces a checkpoint another worker wrote first.
+    session.execute(delete(InventorySnapshot).where(InventorySnapshot.snapshot_date == snapshot_date))
+
+
+def write_snapshot(session: Session, snapshot_date: date, totals: Optional[Totals] = None):
+    _hold_off_writers(session, snapshot_date)
+    if totals is None:
+        totals = _dated_totals(session, snapshot_date)
+    session.add_all(
+        InventorySnapshot(snapshot_date=snapshot_date, warehouse_id=warehouse_id, item_name=name, category=category, quantity=quantity)
+        for (warehouse_id, name, category), quantity in totals.items() if quantity
+    )
+    session.commit()
+
+
+def take_due_snapshots(session: Session) -> int:
+    """Write checkpoints for every closed period since the last one."""
+    if SNAPSHOT_INTERVAL not in ("daily", "monthly"):
+        return 0
+    last = latest_snapshot_date(session)
+    first = last + timedelta(days=1) if last else session.exec(select(func.min(Activity.activity_date))).one()
+    if first is None:
+        return 0
+    written = 0
+    # Only closed days: today's snapshot would go stale with the next entry
+    for snapshot_date in _period_ends(first, date.today() - timedelta(days=1)):
+        write_snapshot(session, snapshot_date)
+        written += 1
+    return written
+
+
+def verify_snapshots(session: Session):
+    """Compare every snapshot with a full replay; return the mismatched dates.
+
+    Snapshots up to the archive cutoff are the baseline for the replay; the
+    one at the cutoff is checked against a replay of the archive files
+    (missing files are reported by archive.verify_archives instead).
+    """
+    mismatched = []
+    cutoff = archive_cutoff(session)
+    if cutoff and not missing_files(archives_between(session)) and _nonzero(add_archived_movements(session, {}, None, cutoff)) != _snapshot_rows(session, cutoff):
+        mismatched.append(cutoff)
+    statement = select(InventorySnapshot.snapshot_date).distinct().order_by(InventorySnapshot.snapshot_date)
+    if cutoff:
+        statement = statement.where(InventorySnapshot.snapshot_date > cutoff)
+    for snapshot_date in session.exec(statement).all():
+        replay = _add_movements(archived_balances(session), session, Activity.activity_date <= snapshot_date)
+        if _nonzero(replay) != _snapshot_rows(session, snapshot_date):
+            mismatched.append(snapshot_date)
+    return mismatched
+
+
+def rebuild_snapshots(session: Session) -> int:
+    # Checkpoints of archived periods are replayed from the archive files
+    cutoff = archive_cutoff(session)
+    archived = session.exec(
+        select(InventorySnapshot.snapshot_date).distinct().where(InventorySnapshot.snapshot_date <= cutoff)
+    ).all() if cutoff else []
+    # Read before deleting anything, so a missing file changes nothing
+    replays = {snapshot_date: add_archived_movements(session, {}, None, snapshot_date) for snapshot_date in archived}
+    session.execute(delete(InventorySnapshot))
+    for snapshot_date, totals in replays.items():
+        write_snapshot(session, snapshot_date, totals)
+    session.commit()
+    return len(replays) + take_due_snapshots(session)
+
+
+class SnapshotJob:
+    """Background task that checks for due snapshots every SNAPSHOT_CHECK_SECONDS."""
+
+    def __init__(self):
+        self._task = None
+
+    async def start(self):
+        if SNAPSHOT_INTERVAL in ("daily", "monthly"):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @staticmethod
+    def _take():
+        with Session(engine) as session:
+            return take_due_snapshots(session)
+
+    async def _run(self):
+        while True:
+            try:
+                written = await run_in_threadpool(self._take)
+                if written:
+                    print(f"Wrote {written} inventory snapshot(s)")
+            except Exception as e:
+                print(f"Inventory snapshot failed: {e}")
+            await asyncio.sleep(SNAPSHOT_CHECK_SECONDS)
+
+
+snapshot_job = SnapshotJob()
+
+
+if __name__ == "__main__":
+    # python snapshots.py [take|rebuild|verify]
+    command = sys.argv[1] if len(sys.argv) > 1 else "take"
+    create_db_and_tables()
+    with Session(engine) as session:
+        if command == "rebuild":
+            print(f"Rebuilt {rebuild_snapshots(session)} snapshot(s).")
+        if command == "take":
+            print(f"Wrote {take_due_snapshots(session)} snapshot(s).")
+        if command in ("rebuild", "verify"):
+            mismatched = verify_snapshots(session)
+            if mismatched:
+                print(f"Snapshots differing from a full replay: {', '.join(map(str, mismatched))}")
+                sys.exit(1)
+            print("All snapshots match a full replay.")
@@ -0,0 +1,91 @@
+import os
+from datetime import date, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from models import Item, StockBalance, DailyMovement
+from inventory import DIRECTION_IN, DIRECTION_OUT, in_warehouse
+
+# Same cut-off as the dashboard's "low stock" card
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+MAX_TREND_DAYS = 366
+
+
+def _by_direction(rows):
+    totals = {DIRECTION_IN: 0, DIRECTION_OUT: 0}
+    for direction, quantity in rows:
+        totals[direction] = quantity or 0
+    return totals
+
+
+def dashboard_stats(session: Session, days: int, today: date = None, warehouse_id: Optional[int] = None):
+    """Dashboard figures read from the daily_movement rollup and stock_balance.
+
+    Every query is bounded by the number of items and days, not by the
+    size of the activity history. With a warehouse, only its rows are read.
+    """
+    today = today or date.today()
+    first_day = today - timedelta(days=days - 1)
+    movements = in_warehouse(DailyMovement.warehouse_id, warehouse_id)
+
+    today_totals = _by_direction(session.exec(
+        select(DailyMovement.direction, func.sum(DailyMovement.quantity))
+        .where(DailyMovement.movement_date == today, *movements)
+        .group_by(DailyMovement.direction)
+    ))
+
+    trend = {first_day + timedelta(days=i): {DIRECTION_IN: 0, DIRECTION_OUT: 0} for i in range(days)}
+    for movement_date, direction, quantity in session.exec(
+        select(DailyMovement.movement_date, DailyMovement.direction, func.sum(DailyMovement.quantity))
+        .where(DailyMovement.movement_date >= first_day, DailyMovement.movement_date <= today, *movements)
+        .group_by(DailyMovement.movement_date, DailyMovement.direction)
+    ):
+        trend[movement_date][direction] = quantity or 0
+
+    categories = {}
+    for category, direction, quantity in session.exec(
+        select(DailyMovement.category, DailyMovement.direction, func.sum(DailyMovement.quantity))
+        .where(DailyMovement.movement_date >= first_day, DailyMovement.movement_date <= today, *movements)
+        .group_by(DailyMovement.category, DailyMovement.direction)
+    ):
+        categories.setdefault(category, {DIRECTION_IN: 0, DIRECTION_OUT: 0})[direction] = quantity or 0
+
+    # One stock figure per item: that warehouse's, or the national total
+    balances = (
+        select(StockBalance.item_name, StockBalance.category, func.sum(StockBalance.quantity).label("quantity"))
+        .where(*in_warehouse(StockBalance.warehouse_id, warehouse_id))
+        .group_by(StockBalance.item_name, StockBalance.category)
+        .subquery()
+    )
+    total_quantity = session.exec(select(func.sum(balances.c.quantity))).one() or 0
+    low_balances = session.exec(
+        select(func.count()).select_from(balances).where(balances.c.quantity <= LOW_STOCK_THRESHOLD)
+    ).one()
+    # Items that never had an approved movement sit at 0, which is low too
+    without_balance = session.exec(
+        select(func.count()).select_from(Item).join(
+            balances,
+            (balances.c.item_name == Item.name) & (balances.c.category == Item.category),
+            isouter=True,
+        ).where(balances.c.item_name == None)  # noqa: E711
+    ).one()
+    item_count = session.exec(select(func.count()).select_from(Item)).one()
+
+    return {
+        "date": today,
+        "in_today": today_totals[DIRECTION_IN],
+        "out_today": today_totals[DIRECTION_OUT],
+        "total_quantity": total_quantity,
+        # Like the dashboard: no master items means nothing is "low"
+        "low_stock": low_balances + without_balance if item_count else 0,
+        "low_stock_threshold": LOW_STOCK_THRESHOLD,
+        "trend": [
+            {"date": day, "in": totals[DIRECTION_IN], "out": totals[DIRECTION_OUT]}
+            for day, totals in trend.items()
+        ],
+        "categories": [
+            {"category": category, "in": totals[DIRECTION_IN], "out": totals[DIRECTION_OUT]}
+            for category, totals in sorted(categories.items())
+        ],
+    }
@@ -0,0 +1,302 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+
+# A throwaway database and archive directory; set before the app modules
+# build their engine
+_tmp = tempfile.mkdtemp(prefix="warehouse-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["ARCHIVE_DIR"] = os.path.join(_tmp, "archive")
+os.environ["SNAPSHOT_INTERVAL"] = "off"
+os.environ.pop("DATABASE_READ_URL", None)
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from main import app
+from database import engine
+from models import Activity, StockBalance, DailyMovement, Warehouse
+from inventory import rebuild_balances, rebuild_daily_movements
+from archive import archive_due_periods
+from snapshots import stock_at, verify_snapshots, write_snapshot
+from changes import current_cursor
+from events import EventBroker, in_scope
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        token = client.post("/api/login", json={"username": "admin", "password": "admin123"}).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
+
+
+def _day(days_ago: int) -> str:
+    return (date.today() - timedelta(days=days_ago)).strftime("%d/%m/%Y")
+
+
+def _activity(client, action: str, days_ago: int = 3, status: str = "Approved", category: str = None) -> dict:
+    response = client.post("/api/activities", json={
+        "date": _day(days_ago), "action": action, "item_category": category,
+        "recipient": "Dugsiga Test", "user": "admin", "status": status,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _ledger():
+    with Session(engine) as session:
+        balances = sorted(
+            (b.warehouse_id, b.item_name, b.category, b.quantity) for b in session.exec(select(StockBalance)) if b.quantity
+        )
+        daily = sorted(
+            (d.warehouse_id, d.movement_date, d.item_name, d.category, d.direction, d.quantity)
+            for d in session.exec(select(DailyMovement)) if d.quantity
+        )
+    return balances, daily
+
+
+def assert_ledger_is_replay():
+    maintained = _ledger()
+    with Session(engine) as session:
+        rebuild_balances(session)
+        rebuild_daily_movements(session)
+    assert _ledger() == maintained
+
+
+def _inventory(client, **params):
+    totals = {}
+    for row in client.get("/api/inventory", params=params).json():
+        key = (row["item_name"], row["category"])
+        totals[key] = totals.get(key, 0) + row["quantity"]
+    return {key: quantity for key, quantity in totals.items() if quantity}
+
+
+def _report(client, **params):
+    response = client.get("/api/reports/inventory", params=params)
+    assert response.status_code == 200, response.text
+    rows = list(csv.reader(io.StringIO(response.content.decode("utf-8-sig"))))[1:]
+    return {(name, category): int(quantity) for name, category, quantity in rows}
+
+
+def test_ledger_matches_full_replay(client):
+    client.post("/api/items", json={"name": "Buug Xisaab", "category": "Books"})
+    kept = _activity(client, "Geliyay: 40 Buug Xisaab")
+    _activity(client, "Bixiyay: 15 Buug Xisaab", days_ago=1)
+    pending = _activity(client, "Bixiyay: 5 Buug Xisaab", status="Pending")
+    removed = _activity(client, "Geliyay: 7 Ghost Item", days_ago=2)
+    assert_ledger_is_replay()
+
+    assert client.patch(f"/api/activities/{pending['id']}", json={"status": "Approved"}).status_code == 200
+    assert client.patch(f"/api/activities/{kept['id']}", json={"status": "Rejected"}).status_code == 200
+    assert_ledger_is_replay()
+
+    assert client.delete(f"/api/activities/{removed['id']}").status_code == 200
+    assert_ledger_is_replay()
+
+
+def test_inventory_report_keys_items_like_the_ledger(client):
+    # Neither item is in the catalogue: each keeps its own row under its own name
+    _activity(client, "Geliyay: 5 Ghost Item")
+    _activity(client, "Geliyay: 3 Other Ghost")
+    inventory = _inventory(client)
+    assert inventory[("Ghost Item", "General")] >= 5
+    assert inventory[("Other Ghost", "General")] == 3
+    assert _report(client) == inventory
+
+
+def test_archive_and_rebuild_keep_balances(client):
+    client.post("/api/items", json={"name": "Kursi", "category": "Furniture"})
+    _activity(client, "Geliyay: 30 Kursi", days_ago=500)
+    _activity(client, "Bixiyay: 4 Kursi", days_ago=480)
+    _activity(client, "Geliyay: 5 Ghost Item", days_ago=470)
+    balances, _ = _ledger()
+    with Session(engine) as session:
+        assert archive_due_periods(session)
+        assert verify_snapshots(session) == []
+    assert_ledger_is_replay()
+    assert _ledger()[0] == balances
+    # Later movements of an archived item add to the same row
+    _activity(client, "Geliyay: 2 Ghost Item")
+    assert_ledger_is_replay()
+    assert _report(client) == _inventory(client)
+
+
+def test_stock_at_is_the_same_with_and_without_snapshots(client):
+    client.post("/api/items", json={"name": "Miis", "category": "Furniture"})
+    _activity(client, "Geliyay: 12 Miis", days_ago=40)
+    _activity(client, "Bixiyay: 5 Miis", days_ago=20)
+    _activity(client, "Geliyay: 4 Ghost Item", days_ago=10)
+    days = [date.today() - timedelta(days=n) for n in (30, 15, 5, 0)]
+    with Session(engine) as session:
+        replayed = [stock_at(session, day) for day in days]
+        for n in (35, 25, 12):
+            write_snapshot(session, date.today() - timedelta(days=n))
+        assert [stock_at(session, day) for day in days] == replayed
+        assert verify_snapshots(session) == []
+
+    # A back-dated entry drops the checkpoints after it instead of leaving them stale
+    _activity(client, "Geliyay: 3 Miis", days_ago=30)
+    with Session(engine) as session:
+        assert verify_snapshots(session) == []
+        today = {(name, category): quantity for name, category, quantity in stock_at(session, date.today())}
+    assert today == _inventory(client)
+
+
+def test_events_are_scoped_to_the_warehouse(client):
+    with Session(engine) as session:
+        other = Warehouse(name="Bakhaarka Test")
+        session.add(other)
+        session.commit()
+        other_id = other.id
+        since = current_cursor(session)
+    mine = _activity(client, "Geliyay: 1 Kursi")
+    theirs = client.post("/api/activities", json={
+        "date": _day(1), "action": "Geliyay: 2 Kursi", "recipient": "Dugsiga Test",
+        "user": "admin", "status": "Approved", "warehouse_id": other_id,
+    }).json()
+    assert theirs["warehouse_id"] == other_id
+
+    events, _, overflow = EventBroker()._load_events(since)
+    assert not overflow
+    def rows(warehouse_id):
+        payloads = [json.loads(item[2]) for item in events if in_scope(item, warehouse_id)]
+        return {payload["row"]["id"]: payload["row"] for payload in payloads if "row" in payload}
+    assert other_id in {row.get("warehouse_id") for row in rows(None).values()}
+    scoped = rows(mine["warehouse_id"])
+    assert mine["id"] in scoped
+    assert {row.get("warehouse_id", mine["warehouse_id"]) for row in scoped.values()} == {mine["warehouse_id"]}
+
+
+def test_sync_returns_every_write_once(client):
+    cursor = client.get("/api/sync").json()["cursor"]
+    seen = []
+    def sync():
+        nonlocal cursor
+        delta = client.get("/api/sync", params={"since": cursor}).json()
+        assert not delta["reset"]
+        cursor = delta["cursor"]
+        seen.extend(("upsert", row["id"]) for row in delta["activities"])
+        seen.extend(("delete", row_id) for row_id in delta["deleted"]["activities"])
+
+    written = []
+    for n in range(5):
+        written.append(("upsert", _activity(client, f"Geliyay: {n + 1} Kursi")["id"]))
+        if n % 2:
+            sync()
+    removed = written.pop(0)[1]
+    assert client.delete(f"/api/activities/{removed}").status_code == 200
+    sync()
+    sync()
+    # The first sync already sent the created row; the later one sends its delete
+    assert sorted(seen) == sorted([("upsert", removed), *written, ("delete", removed)])
+
+
+def test_metrics_need_an_admin(client):
+    assert TestClient(app).get("/metrics").status_code == 401
+    assert client.get("/metrics").status_code == 200
+
+
+def test_lists_are_paged_unless_asked_for_everything(client, monkeypatch):
+    monkeypatch.setattr("pagination.DEFAULT_PAGE_SIZE", 2)
+    page = client.get("/api/activities")
+    assert len(page.json()) == 2 and page.headers["X-Next-Cursor"]
+    everything = client.get("/api/activities", params={"limit": 0})
+    assert len(everything.json()) > 2 and "X-Next-Cursor" not in everything.headers
+
+
+def _login(username: str, password: str) -> TestClient:
+    other = TestClient(app)
+    token = other.post("/api/login", json={"username": username, "password": password}).json()["access_token"]
+    other.headers["Authorization"] = f"Bearer {token}"
+    return other
+
+
+def test_storekeeper_cannot_delete_someone_elses_transfer(client):
+    source = client.post("/api/warehouses", json={"name": "Bakhaarka Bari"}).json()
+    destination = client.post("/api/warehouses", json={"name": "Bakhaarka Galbeed"}).json()
+    legs = client.post("/api/transfers", json={
+        "from_warehouse_id": source["id"], "to_warehouse_id": destination["id"], "item": "Sabuurad", "quantity": 5,
+    }).json()
+    before = _inventory(client, warehouse_id=destination["id"])
+    client.post("/api/users", json={"username": "hawa", "password": "hawa123", "name": "Hawa", "role": "storekeeper"})
+    storekeeper = _login("hawa", "hawa123")
+
+    # A transfer_id in the body is ignored: the row doesn't join the transfer
+    own = storekeeper.post("/api/activities", json={
+        "date": _day(1), "action": "Geliyay: 1 Sabuurad", "recipient": "x", "user": "Hawa",
+        "status": "Pending", "warehouse_id": source["id"], "transfer_id": legs[0]["transfer_id"],
+    }).json()
+    assert own["transfer_id"] is None
+    assert storekeeper.delete(f"/api/activities/{own['id']}").status_code == 200
+    assert _inventory(client, warehouse_id=destination["id"]) == before
+
+    # Even a row already linked to the transfer can't take the approved legs with it
+    with Session(engine) as session:
+        row = Activity(date=_day(1), action="Geliyay: 1 Sabuurad", recipient="x", user="Hawa", status="Pending",
+                       warehouse_id=source["id"], transfer_id=legs[0]["transfer_id"])
+        session.add(row)
+        session.commit()
+        row_id = row.id
+    assert storekeeper.delete(f"/api/activities/{row_id}").status_code == 403
+    assert _inventory(client, warehouse_id=destination["id"]) == before
+    assert_ledger_is_replay()
+
+
+def test_movement_comes_from_the_action_text(client):
+    before = _inventory(client).get(("Laptop", "General"), 0)
+    row = _activity(client, "Geliyay: 5 Laptop", status="Pending")
+    tampered = client.post("/api/activities", json={
+        "date": _day(1), "action": "Geliyay: 5 Laptop", "recipient": "x", "user": "admin",
+        "status": "Pending", "quantity": 5000, "direction": "sideways", "item_id": 1,
+    }).json()
+    assert (tampered["direction"], tampered["quantity"], tampered["item_id"]) == ("in", 5, row["item_id"])
+    unknown = _activity(client, "Tuuray: 5 Laptop", status="Pending")
+    assert unknown["direction"] is None
+    response = client.post("/api/approvals/batch", json={"ids": [row["id"], tampered["id"], unknown["id"]], "status": "Approved"})
+    assert response.status_code == 200
+    assert _inventory(client)[("Laptop", "General")] == before + 10
+    assert _report(client) == _inventory(client)
+    assert_ledger_is_replay()
+
+
+def test_batch_approval_rejects_ids_that_are_not_integers(client):
+    for ids in ([[1]], [True], ["1"], [1.5]):
+        response = client.post("/api/approvals/batch", json={"ids": ids, "status": "Approved"})
+        assert response.status_code == 400, ids
+
+
+def test_bulk_import_resolves_items_without_a_query_per_row(client):
+    from sqlalchemy import event
+    client.post("/api/items", json={"name": "Kabadh", "category": "Furniture"})
+    rows = [
+        {"date": _day(2), "action": f"Geliyay: {n} {name}", "recipient": "x", "user": "admin", "status": "Approved"}
+        for n, name in enumerate(["Kabadh", "Uncatalogued A", "Uncatalogued B", "Uncatalogued C"] * 5, 1)
+    ]
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = client.post("/api/activities/bulk", json={"activities": rows, "batch_key": "bulk-kabadh"}).json()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert result["inserted"] == len(rows) and not result["errors"]
+    # One item query for the batch, none per row
+    assert not [s for s in statements if "item.name = " in s]
+    assert_ledger_is_replay()
+
+    # The key belongs to an activities import; an items import can't replay it
+    response = client.post("/api/items/bulk", json={"items": [{"name": "x", "category": "y"}], "batch_key": "bulk-kabadh"})
+    assert response.status_code == 409
+
+
+def test_users_need_a_known_warehouse(client):
+    response = client.post("/api/users", json={"username": "faarax", "password": "x", "name": "Faarax", "warehouse_id": 999})
+    assert response.status_code == 400
+    user = client.post("/api/users", json={"username": "faarax", "password": "x", "name": "Faarax"}).json()
+    assert client.patch(f"/api/users/{user['id']}", json={"warehouse_id": 999}).status_code == 400
+    assert client.patch(f"/api/users/{user['id']}", json={"warehouse_id": None}).status_code == 200
@@ -0,0 +1,130 @@
+import os
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from database import engine
+from models import Warehouse, Activity
+from inventory import ACTION_IN, ACTION_OUT
+from cache import reference_cache
+from etags import table_versions
+from changes import record_reset
+from security import current_user
+
+# Name given to the warehouse that existing activities and stock move into.
+# The seed scripts credit their stock to this office.
+DEFAULT_WAREHOUSE = os.getenv("DEFAULT_WAREHOUSE", "Xafiiska Waxbarashada")
+
+_default_id = None
+
+
+def ensure_default_warehouse(engine) -> int:
+    """Create the first warehouse on a database that has none; return its id."""
+    with Session(engine) as session:
+        warehouse_id = session.exec(select(func.min(Warehouse.id))).one()
+        if warehouse_id is None:
+            warehouse = Warehouse(name=DEFAULT_WAREHOUSE)
+            session.add(warehouse)
+            session.commit()
+            warehouse_id = warehouse.id
+    return warehouse_id
+
+
+def default_warehouse_id(session: Optional[Session] = None) -> int:
+    """The lowest warehouse id: where entries without a warehouse are booked.
+
+    Warehouses are never deleted, so it is looked up once per process.
+    """
+    global _default_id
+    if _default_id is None:
+        if session is None:
+            with Session(engine) as own_session:
+                return default_warehouse_id(own_session)
+        _default_id = session.exec(select(func.min(Warehouse.id))).one()
+    return _default_id
+
+
+def list_warehouses(session: Session) -> List[dict]:
+    # Keyed by the table version, so a warehouse added by another worker
+    # shows up (and passes known_warehouse) within ETAG_VERSION_TTL
+    return reference_cache.get_or_load(
+        # Read through the caller's session: with DB_ASYNC it runs on the async engine
+        ("warehouses", "all", table_versions.get("warehouses", session)),
+        lambda: [warehouse.model_dump() for warehouse in session.exec(select(Warehouse).order_by(Warehouse.id))],
+    )
+
+
+def known_warehouse(session: Session, warehouse_id: Optional[int]) -> bool:
+    return any(warehouse["id"] == warehouse_id for warehouse in list_warehouses(session))
+
+
+def invalidate_warehouses():
+    reference_cache.invalidate("warehouses")
+
+
+def backfill_warehouses(engine) -> int:
+    """Book activities from before warehouses existed into the default one."""
+    warehouse_id = ensure_default_warehouse(engine)
+    with Session(engine) as session:
+        result = session.execute(
+            update(Activity).where(Activity.warehouse_id == None).values(warehouse_id=warehouse_id)  # noqa: E711
+        )
+        if result.rowcount:
+            # A plain UPDATE isn't journalled row by row; clients resync instead
+            record_reset(session, "activities")
+        session.commit()
+    return result.rowcount
+
+
+def populate_warehouse(session: Session, activity: Activity):
+    if activity.warehouse_id is None:
+        activity.warehouse_id = default_warehouse_id(session)
+
+
+# --- Request scope ---
+def warehouse_scope(request: Request, warehouse_id: Optional[int] = None) -> Optional[int]:
+    """Route dependency: the warehouse a request is limited to, or None for all.
+
+    Users attached to a warehouse always get theirs; everyone else picks one
+    with ?warehouse_id= or sees the national figures without it.
+    """
+    assigned = current_user(request).get("warehouse_id")
+    if assigned is None:
+        return warehouse_id
+    if warehouse_id is not None and warehouse_id != assigned:
+        raise HTTPException(status_code=403, detail="Not allowed for your warehouse")
+    return assigned
+
+
+def check_warehouse(request: Request, warehouse_id: Optional[int]):
+    """403 when a user attached to a warehouse writes to another one."""
+    assigned = current_user(request).get("warehouse_id")
+    if assigned is not None and warehouse_id != assigned:
+        raise HTTPException(status_code=403, detail="Not allowed for your warehouse")
+
+
+# --- Transfers ---
+def transfer_legs(source: Warehouse, destination: Warehouse, item_name: str, quantity: int, **fields) -> Tuple[Activity, Activity]:
+    """The outbound and inbound activities that make up one transfer.
+
+    Each leg is an ordinary movement in its own warehouse, so balances,
+    rollups and reports need nothing special for transfers.
+    """
+    outbound = Activity(
+        action=f"{ACTION_OUT}: {quantity} {item_name}", recipient=destination.name, warehouse_id=source.id, **fields
+    )
+    inbound = Activity(
+        action=f"{ACTION_IN}: {quantity} {item_name}", recipient=source.name, warehouse_id=destination.id, **fields
+    )
+    return outbound, inbound
+
+
+def transfer_partners(session: Session, activities) -> List[Activity]:
+    """The other leg of every transfer among `activities`."""
+    transfer_ids = {activity.transfer_id for activity in activities if activity.transfer_id}
+    if not transfer_ids:
+        return []
+    known = {activity.id for activity in activities}
+    legs = session.exec(select(Activity).where(Activity.transfer_id.in_(transfer_ids))).all()
+    return [leg for leg in legs if leg.id not in known]